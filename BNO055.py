@@ -7,6 +7,20 @@
 #  this communication, which the higher level methods use these to read and write calibration 
 #  values use. The mode determines the functionality of the sensor, and is set through the @_set_mode
 #  method. 
+#  The gyro and Euler angle registers are contiguous, so @c read_snapshot() reads all of them in one I2C
+#  burst and caches the decoded values with a timestamp. The getters reuse the cached values while they are
+#  no older than @c max_age microseconds, so several calls in one scheduler tick only touch the bus once.
+#  Snapshots are read into a persistent buffer and decoded into the preallocated @c DATA array, indexed by
+#  the @c GYRO_X ... @c PITCH constants, so reading the IMU does not allocate memory.
+#  Calibration data can be saved and restored as a binary blob: a 4 byte header (magic, version, checksum)
+#  followed by the 22 raw calibration bytes, which @c write_calibration_blob() restores in one burst write.
+#  Mode switches can be started with @c begin_mode() and polled with @c ready() instead of sleeping, and the
+#  @c boot() generator finishes initialization and calibration restore as a scheduler task.
+#  Every snapshot also updates an unwrapped heading which keeps counting past 360 degrees in either direction,
+#  so the degrees turned since any earlier @c get_total_heading() mark can be found with one subtraction.
+#  The IMU can share its bus with other devices through an @c i2cManager.I2CManager, which is passed in place
+#  of the bus number. @c request_snapshot() then queues the snapshot read with the manager instead of blocking
+#  the calling task, and the snapshot is decoded when the bus task completes the read.
 #
 #  @author Cole Sterba, Devon Bolt
 #  @date   2024-Nov-12 Approximate date of creation of file
@@ -28,6 +42,7 @@
 #  POSSIBILITY OF SUCH DAMAGE.
 
 
+import array
 import time
 from pyb import I2C # type: ignore 
 
@@ -39,7 +54,22 @@ class BNO055:
     BNO055_CALIB_STAT_ADDR = 0x35
     BNO055_EULER_H_LSB_ADDR = 0x1A
     BNO055_GYRO_DATA_X_LSB_ADDR = 0x14
+    BNO055_SNAPSHOT_LEN = 12 # gyro x, y, z then euler heading, roll, pitch (0x14-0x1F)
+
+    # Indices of the decoded values in DATA, in register order
+    GYRO_X = 0
+    GYRO_Y = 1
+    GYRO_Z = 2
+    HEADING = 3
+    ROLL = 4
+    PITCH = 5
     BNO055_CALIB_DATA_ADDR = 0x55 # start of the calibration data addresses
+    BNO055_CALIB_DATA_LEN = 22
+
+    # Binary calibration blob header
+    CALIB_BLOB_MAGIC = b'BC'
+    CALIB_BLOB_VERSION = 1
+    CALIB_BLOB_HEADER_LEN = 4 # magic (2 bytes), version, checksum
 
     # Operation modes
     CONFIG_MODE = 0x00
@@ -50,13 +80,38 @@ class BNO055:
     M4G_MODE = 0x0A
     NDOF_FMC_OFF_MODE = 0x0B
     NDOF_MODE = 0x0C  
+
+    MODE_SWITCH_MS = 50 # time allowed for a mode switch to settle
     
 
-    def __init__(self, i2c_bus):
-        # Initialize I2C connection
-        self.i2c = I2C(i2c_bus, I2C.MASTER)
-        self.i2c.init(I2C.MASTER, baudrate=400000)
-        self._set_mode(self.NDOF_MODE)
+    def __init__(self, i2c_bus, max_age=0, blocking=True):
+        """Initialize the IMU
+        @param i2c_bus Number of the I2C bus the IMU is connected to, or an I2CManager that owns the bus
+        @param max_age Oldest snapshot in microseconds the getters will return before reading the sensor again
+        @param blocking If False, the switch to NDOF mode is started but not waited for. Run boot() to finish initialization"""
+        self.max_age = max_age
+        self.snapshot_time = None # ticks_us of the last snapshot, None until the first one is read
+        self._raw = bytearray(self.BNO055_SNAPSHOT_LEN) # persistent buffer the snapshot registers are read into
+        self.DATA = array.array('f', [0]*6) # decoded snapshot, see the GYRO_X ... PITCH indices
+        self.calib_status = 0
+        self.calibration_accepted = None # result of the calibration restore in boot(), None if none was done
+        self.total_heading = 0.0 # unwrapped heading in degrees, accumulated from every snapshot
+        self.heading_rate = 0.0 # degrees per second between the last two snapshots
+        self._last_heading = None # heading of the previous snapshot, None if there is no previous snapshot
+        self._mode_ready_time = time.ticks_ms() # ticks_ms when the last mode switch has settled
+        # Initialize I2C connection, a bus manager is used directly since it reads and writes like pyb.I2C
+        if isinstance(i2c_bus, int):
+            self.i2c = I2C(i2c_bus, I2C.MASTER)
+            self.i2c.init(I2C.MASTER, baudrate=400000)
+        else:
+            self.i2c = i2c_bus
+        self._snapshot_done = self._on_snapshot # bound once so queueing a snapshot does not allocate
+        self.snapshot_request = None # request queued by request_snapshot(), None if there is none
+        if blocking:
+            self._set_mode(self.NDOF_MODE)
+        else:
+            self.begin_mode(self.NDOF_MODE)
+        self.initialized = blocking # True once the IMU is in NDOF mode with its calibration restored
         #while not self.get_calibration_status():
         #   print(self.get_calibration_status_values())
         #   time.sleep(0.05)
@@ -71,9 +126,47 @@ class BNO055:
         return self.i2c.mem_read(1, self.BNO055_I2C_ADDR, register)[0]
 
     def _set_mode(self, mode):
-        """Set the operation mode of the BNO055."""
+        """Set the operation mode of the BNO055, waiting for the switch to finish."""
+        self.wait_ready()
+        self.begin_mode(mode)
+        self.wait_ready()
+
+    def begin_mode(self, mode):
+        """Start switching the operation mode of the BNO055 without waiting. ready() reports when it has settled."""
         self._write_byte(self.BNO055_OPR_MODE_ADDR, mode)
-        time.sleep(0.05)  # Delay to allow mode switch
+        self._mode_ready_time = time.ticks_add(time.ticks_ms(), self.MODE_SWITCH_MS)
+
+    def ready(self):
+        """Check whether the last mode switch has settled."""
+        return time.ticks_diff(time.ticks_ms(), self._mode_ready_time) >= 0
+
+    def wait_ready(self):
+        """Sleep until the last mode switch has settled."""
+        remaining = time.ticks_diff(self._mode_ready_time, time.ticks_ms())
+        if remaining > 0:
+            time.sleep_ms(remaining)  # Delay to allow mode switch
+
+    def boot(self, blob=None):
+        """Generator task that finishes initialization without blocking the scheduler.
+        Waits for the mode switch started in the constructor, then restores the calibration blob if one is given.
+        Yields 0 while busy and 1 once the IMU is initialized.
+        @param blob Calibration blob from read_calibration_blob(), or None to skip the restore"""
+        while not self.ready():
+            yield 0
+        if blob is not None:
+            data = self._unpack_calibration_blob(blob)
+            self.begin_mode(self.CONFIG_MODE)
+            while not self.ready():
+                yield 0
+            self.i2c.mem_write(data, self.BNO055_I2C_ADDR, self.BNO055_CALIB_DATA_ADDR)
+            self.calibration_accepted = self.i2c.mem_read(self.BNO055_CALIB_DATA_LEN, self.BNO055_I2C_ADDR, 
+                                                          self.BNO055_CALIB_DATA_ADDR) == data
+            self.begin_mode(self.NDOF_MODE)
+            while not self.ready():
+                yield 0
+        self.initialized = True
+        while True:
+            yield 1
 
     def get_calibration_status(self):
         """Get the calibration status of the sensor."""
@@ -92,61 +185,158 @@ class BNO055:
         mag = calib_status & 0x03
         return {'sys': sys, 'gyro': gyro, 'accel': accel, 'mag': mag}
 
-    def write_calibration_data(self, data):     # Assumes data array is in the right format
-        """Write calibration data to the sensor."""
+    def write_calibration_data(self, data):
+        """Write calibration data to the sensor.
+        @param data The 22 calibration values, as integers or strings of integers"""
+        data = bytes(int(byte) for byte in data)
         self._set_mode(self.CONFIG_MODE)
-        for i, byte in enumerate(data):
-            self._write_byte(self.BNO055_CALIB_DATA_ADDR + i, byte)
+        self.i2c.mem_write(data, self.BNO055_I2C_ADDR, self.BNO055_CALIB_DATA_ADDR)
         self._set_mode(self.NDOF_MODE)
 
     def read_calibration_data(self):
         """Read calibration data from the sensor."""
         self._set_mode(self.CONFIG_MODE)
-        data = [self._read_byte(self.BNO055_CALIB_DATA_ADDR + i) for i in range(22)]
+        data = list(self.i2c.mem_read(self.BNO055_CALIB_DATA_LEN, self.BNO055_I2C_ADDR, self.BNO055_CALIB_DATA_ADDR))
+        self._set_mode(self.NDOF_MODE)
+        return data
+
+    def _checksum(self, data):
+        """8 bit sum of the calibration bytes, stored in the blob header."""
+        return sum(data) & 0xFF
+
+    def read_calibration_blob(self):
+        """Read calibration data from the sensor as a binary blob with a header.
+        @return bytes holding the header followed by the 22 calibration bytes"""
+        self._set_mode(self.CONFIG_MODE)
+        data = self.i2c.mem_read(self.BNO055_CALIB_DATA_LEN, self.BNO055_I2C_ADDR, self.BNO055_CALIB_DATA_ADDR)
         self._set_mode(self.NDOF_MODE)
+        return self.pack_calibration_blob(data)
+
+    def pack_calibration_blob(self, data):
+        """Build a calibration blob from the 22 calibration values.
+        @param data The calibration values, as integers or strings of integers"""
+        data = bytes(int(byte) for byte in data)
+        return self.CALIB_BLOB_MAGIC + bytes([self.CALIB_BLOB_VERSION, self._checksum(data)]) + data
+
+    def _unpack_calibration_blob(self, blob):
+        """Check the header of a calibration blob and return its 22 calibration bytes."""
+        if len(blob) != self.CALIB_BLOB_HEADER_LEN + self.BNO055_CALIB_DATA_LEN or blob[0:2] != self.CALIB_BLOB_MAGIC:
+            raise ValueError("not a BNO055 calibration blob")
+        if blob[2] != self.CALIB_BLOB_VERSION:
+            raise ValueError("unsupported calibration blob version")
+        data = bytes(blob[self.CALIB_BLOB_HEADER_LEN:])
+        if blob[3] != self._checksum(data):
+            raise ValueError("calibration blob checksum mismatch")
         return data
 
+    def write_calibration_blob(self, blob):
+        """Restore calibration data from a binary blob in one burst write, then read it back to check it.
+        @param blob bytes from read_calibration_blob()
+        @return True if the sensor holds the restored data, False if it did not accept it"""
+        data = self._unpack_calibration_blob(blob)
+        self._set_mode(self.CONFIG_MODE)
+        self.i2c.mem_write(data, self.BNO055_I2C_ADDR, self.BNO055_CALIB_DATA_ADDR)
+        accepted = self.i2c.mem_read(self.BNO055_CALIB_DATA_LEN, self.BNO055_I2C_ADDR, self.BNO055_CALIB_DATA_ADDR) == data
+        self._set_mode(self.NDOF_MODE)
+        return accepted
+
+    def read_snapshot(self, calib=False):
+        """Read the gyro and Euler angle registers in one burst and cache the decoded values.
+        @param calib If True, also read the calibration status register"""
+        self.i2c.mem_read(self._raw, self.BNO055_I2C_ADDR, self.BNO055_GYRO_DATA_X_LSB_ADDR)
+        if calib:
+            self.calib_status = self._read_byte(self.BNO055_CALIB_STAT_ADDR)
+        self._decode_snapshot()
+
+    def request_snapshot(self, priority=1):
+        """Queue a snapshot read with the bus manager, which decodes it when the bus task runs the read.
+        @param priority Priority of the read in the bus manager queue
+        @return True if the read is queued or already pending, False if the IMU is not on a bus manager or its queue is full"""
+        if not hasattr(self.i2c, "submit_read"):
+            return False
+        if self.snapshot_request is None:
+            self.snapshot_request = self.i2c.submit_read(self.BNO055_I2C_ADDR, self.BNO055_GYRO_DATA_X_LSB_ADDR,
+                                                         self._raw, priority, self._snapshot_done)
+        return self.snapshot_request is not None
+
+    def _on_snapshot(self, request):
+        """Bus manager callback for a queued snapshot read."""
+        self.snapshot_request = None
+        self._decode_snapshot()
+
+    def _decode_snapshot(self):
+        """Decode the raw snapshot registers into DATA and update the heading accumulator."""
+        raw_data = self._raw
+        data = self.DATA
+        for i in range(6):
+            value = (raw_data[2*i+1] << 8 | raw_data[2*i])
+            if value >= 0x8000:  # correcting for signed value
+                value -= 0x10000
+            data[i] = value / 16.0 # 1/16 degree (per second) units
+        now = time.ticks_us()
+        
+        # Accumulate the unwrapped heading. Headings read before boot() finishes are not valid fusion output
+        heading = data[self.HEADING]
+        if not self.initialized:
+            self._last_heading = None
+        elif self._last_heading is None:
+            self.total_heading = heading
+            self._last_heading = heading
+        else:
+            delta = self.wrap_angle(heading - self._last_heading)
+            self.total_heading += delta
+            self._last_heading = heading
+            elapsed = time.ticks_diff(now, self.snapshot_time)
+            if elapsed > 0:
+                self.heading_rate = delta*1_000_000/elapsed
+        self.snapshot_time = now
+
+    def wrap_angle(self, angle):
+        """Wrap an angle in degrees to the range -180 to 180."""
+        if angle > 180: angle -= 360
+        if angle < -180: angle += 360
+        return angle
+
+    def _refresh(self):
+        """Read a new snapshot if the cached one is older than max_age."""
+        if self.snapshot_time is None or time.ticks_diff(time.ticks_us(), self.snapshot_time) > self.max_age:
+            self.read_snapshot()
+
+    def get_data(self):
+        """Get the preallocated snapshot array (see the GYRO_X ... PITCH indices). No new objects are created."""
+        self._refresh()
+        return self.DATA
+
     def get_euler_angles(self):
         """Get Euler angles (heading, roll, pitch) in degrees."""
-        raw_data = self.i2c.mem_read(6, self.BNO055_I2C_ADDR, self.BNO055_EULER_H_LSB_ADDR)
-        heading = (raw_data[1] << 8 | raw_data[0])
-        if heading >= 0x8000:  # correcting for signed value
-            heading -= 0x10000
-        heading = heading / 16.0
-        roll = (raw_data[3] << 8 | raw_data[2])
-        if roll >= 0x8000:  # correcting for signed value
-            roll -= 0x10000
-        roll = roll / 16.0
-        pitch = (raw_data[5] << 8 | raw_data[4])
-        if pitch >= 0x8000:  # correcting for signed value
-            pitch -= 0x10000
-        pitch = pitch / 16.0
-        return {'heading': heading, 'roll': roll, 'pitch': pitch}
+        self._refresh()
+        data = self.DATA
+        return {'heading': data[self.HEADING], 'roll': data[self.ROLL], 'pitch': data[self.PITCH]}
     
     def get_heading(self):
         """Get the heading (yaw) angle in degrees."""
-        # Read 2 bytes for the heading (yaw) angle
-        raw_data = self.i2c.mem_read(2, self.BNO055_I2C_ADDR, self.BNO055_EULER_H_LSB_ADDR)
-        heading = (raw_data[1] << 8 | raw_data[0])
-        if heading >= 0x8000:  # correcting for signed value
-            heading -= 0x10000
-        heading = heading / 16.0
-        return heading
+        self._refresh()
+        return self.DATA[self.HEADING]
+
+    def get_total_heading(self):
+        """Get the unwrapped heading in degrees, which does not jump at 0/360. Use it as a mark for heading_change_since()."""
+        self._refresh()
+        return self.total_heading
+
+    def heading_change_since(self, mark):
+        """Get the degrees turned since a mark taken with get_total_heading(). Positive is clockwise.
+        @param mark An earlier value of get_total_heading()"""
+        self._refresh()
+        return self.total_heading - mark
+
+    def get_heading_rate(self):
+        """Get the rate of change of the heading in degrees per second, from the last two snapshots."""
+        self._refresh()
+        return self.heading_rate
 
     def get_angular_velocity(self):
         """Get angular velocity (x, y, z) in degrees per second."""
-        raw_data = self.i2c.mem_read(6, self.BNO055_I2C_ADDR, self.BNO055_GYRO_DATA_X_LSB_ADDR)
-        x = (raw_data[1] << 8 | raw_data[0])
-        if x >= 0x8000: # correcting for signed value
-            x-=0x10000
-        x = x / 16.0
-        y = (raw_data[3] << 8 | raw_data[2])
-        if y >= 0x8000: # correcting for signed value
-            y-=0x10000
-        y = y / 16.0
-        z = (raw_data[5] << 8 | raw_data[4])
-        if z >= 0x8000: # correcting for signed value
-            z-=0x10000
-        z = z / 16.0
-        return {'x': x, 'y': y, 'z': z}
+        self._refresh()
+        data = self.DATA
+        return {'x': data[self.GYRO_X], 'y': data[self.GYRO_Y], 'z': data[self.GYRO_Z]}
     
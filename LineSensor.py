@@ -11,6 +11,24 @@
 #  This value is between -1 and 1 which represents the position of a line along the array, zero being centered. 
 #  In order to do this, readings are linearized and have thresholds applied based on testing done. 
 #  The @c get_line_position() method returns this value.
+#  When the array is created with @c parallel_read set, all 8 sensors are charged and released together
+#  and timed in a single polling loop by @c update_values_parallel(), so a full read takes at most one
+#  @c MAX_DECAY_TIME instead of up to 8 of them.
+#  The thresholds are kept in a per-sensor table which can be replaced at boot with @c load_calibration(),
+#  allowing a different calibration for each course surface.
+#  The @c sample() generator can be run as a scheduler task which reads the array once per period. Each read is
+#  stamped with @c ticks_us, and @c get_line_position() can be given a maximum age so that callers reuse the
+#  cached reading instead of triggering another blocking read.
+#  When @c high_res is set, the line position is estimated by @c interpolate() from the continuous decay times instead
+#  of the centroid of the thresholded readings, giving a smooth position rather than a few dozen discrete values.
+#  When @c roi is set, most reads only time the sensors around the last known line position. A full sweep of all
+#  8 sensors is still done periodically and whenever the line is lost, reaches the edge of the region, or fills the
+#  region (a possible horizontal finish line).
+#  When @c early_cutoff is set, each sensor stops timing its decay at its highest calibration breakpoint, since
+#  any longer decay gives the same thresholded reading.
+#  The @c AnalogLineSensorArray class is an alternative backend for analog reflectance arrays (QTR-8A style wiring).
+#  It samples every channel with the ADC into preallocated buffers and reuses the thresholding, centroid, and finish
+#  line logic of @c LineSensorArray.
 # 
 # 
 #  @author Cole Sterba, Devon Bolt
@@ -33,6 +51,8 @@
 #  POSSIBILITY OF SUCH DAMAGE.
 
 
+import array
+import math
 import time
 from pyb import Pin, ADC # type: ignore 
 
@@ -51,6 +71,7 @@ class LineSensor:
         self.VALUE_PIN = Pin(Value_pin, mode=Pin.OUT_PP)
         self.LED_PIN = Pin(LED_pin, mode=Pin.OUT_PP)
         self.MAX_DECAY_TIME = 2000
+        self.CUTOFF = self.MAX_DECAY_TIME # decay timing stops at this time, can be lowered to end reads early
         self.update_value()
 
     def update_value(self):
@@ -58,16 +79,15 @@ class LineSensor:
         reads the analog value of the line sensor
         Step 1: Turn the LED On
         Step 2: Set the Value_Pin to an output and drive it high for at least 10 microseconds
-        Step 3: Set the Value_Pin to an input and measure the time it takes to decay in microseconds. Decay time is capped by the internal parameter MAX_DECAY_TIME
+        Step 3: Set the Value_Pin to an input and measure the time it takes to decay in microseconds. Decay time is capped by the internal parameter CUTOFF
         Step 4: Turn LED off
         Step 5: Sets the internal VALUE parameter to the measured decay time
         """
         
         self.LED_PIN.high() # Step 1
 
-        self.VALUE_PIN = Pin(self.VALUE_PIN_NUMBER, mode=Pin.OUT_PP) # Step 2
+        self.VALUE_PIN.init(Pin.OUT_PP) # Step 2, reconfigures the existing pin so no new Pin object is allocated
         self.VALUE_PIN.high()
-        # self.VALUE_PIN = ADC(self.VALUE_PIN_NUMBER) # May not need this line
 
         # Waiting for 10 us
         start = time.ticks_us()
@@ -76,14 +96,14 @@ class LineSensor:
             pass
 
         # Setting Value Pin to input
-        self.VALUE_PIN = Pin(self.VALUE_PIN_NUMBER, mode=Pin.IN) # Step 3
+        self.VALUE_PIN.init(Pin.IN) # Step 3
 
         # Waiting until pin goes low
         start = time.ticks_us()
         decay_time = -1 # if decay_time stays at -1, it can be caught with an error later
         while(self.VALUE_PIN.value()>0):
             decay_time = time.ticks_diff(time.ticks_us(), start) # gets time since start in usec
-            if(decay_time>=self.MAX_DECAY_TIME): # if bigger than cutoff time, break
+            if(decay_time>=self.CUTOFF): # if bigger than cutoff time, break
                 break
         
         self.VALUE = decay_time # set value to decay time in us
@@ -101,12 +121,16 @@ class LineSensor:
 class LineSensorArray:
     '''!@brief Class for an array of line sensor objects
     '''
-    def __init__(self, Even_pin, Odd_pin, Pin_list): 
+    def __init__(self, Even_pin, Odd_pin, Pin_list, parallel_read=False, high_res=False, roi=False, early_cutoff=False): 
         """!
         Initializes the LineSensorArray object by setting up an array of line sensor object.
         @param Even_pin: Pin to control the even number line sensor array LEDs
         @param Odd_pin: Pin to control the odd number line sensor array LEDs
         @param Pin_List: Ordered list of the analog output pins of the line sensor array
+        @param parallel_read: If True, all sensors are read together in one decay timing loop
+        @param high_res: If True, the line position is interpolated from the continuous readings instead of using the centroid
+        @param roi: If True, only the sensors around the last line position are read on most updates
+        @param early_cutoff: If True, each sensor stops timing once its reading can no longer change (see set_early_cutoff())
         """
         self.SENSOR_LIST = [LineSensor(Pin_list[0], Even_pin), 
                             LineSensor(Pin_list[1], Odd_pin),
@@ -116,15 +140,54 @@ class LineSensorArray:
                             LineSensor(Pin_list[5], Odd_pin),
                             LineSensor(Pin_list[6], Even_pin),
                             LineSensor(Pin_list[7], Odd_pin)]
+        self._setup(parallel_read, high_res, roi, early_cutoff)
+
+    def _setup(self, parallel_read, high_res, roi, early_cutoff):
+        """
+        Sets up the calibration table, buffers, and read modes shared by every line sensor array backend
+        """
         self.LINE_POSITION = 0
         self.NUM_SENSORS = 8
         self.ALL_ON_PERCENT = 0.85 # if more than this percent of the sum of the sensor readings, horizontal line hit
+        self.PARALLEL_READ = parallel_read
+        self.HIGH_RES = high_res
+        self.ROI = roi
+        self.ROI_HALF_WIDTH = 2 # number of sensors read on each side of the last line position in ROI mode
+        self.ROI_FULL_PERIOD = 10 # number of ROI reads between forced full sweeps
+        # Breakpoints (in us) between the 0, 0.5, 0.75, and 1 thresholded readings, 3 per sensor
+        # Tuned from the settling time vs reflectance calibration data, can be replaced with load_calibration()
+        self.THRESHOLDS = array.array('H', [600, 1200, 1800,
+                                            700, 1200, 1900,
+                                            600, 1100, 1700,
+                                            600, 1100, 1700,
+                                            700, 1200, 1600,
+                                            600, 1000, 1600,
+                                            600, 1100, 1900,
+                                            800, 1300, 1950])
+        # Third order linearization coefficients (a, b, c, d), 4 per sensor, used by linearize()
+        # Placeholder fit shared by all sensors, can be replaced with load_calibration()
+        self.LINEAR_COEFFS = array.array('f', [1.37e-6, -5.72e-3, 8.32, -2.72e3]*self.NUM_SENSORS)
+        # Buffers reused on every read so that reading the line does not allocate memory
+        self.READINGS = array.array('B', [0]*self.NUM_SENSORS) # thresholded readings in quarters (0, 2, 3, 4)
+        # Smallest readings total (in quarters) that counts as a horizontal line, for each number of sensors read
+        self.ALL_ON_LEVELS = array.array('B', [math.ceil(width*4*self.ALL_ON_PERCENT) for width in range(self.NUM_SENSORS+1)])
+        self.ALL_ON_LEVEL = self.ALL_ON_LEVELS[self.NUM_SENSORS]
+        self._done = bytearray(self.NUM_SENSORS) # flags for sensors that finished decaying in update_values_parallel()
+        self.VALUES = array.array('h', [0]*self.NUM_SENSORS) # raw decay times from the most recent read
+        self.TIMESTAMP = time.ticks_us() # time in us that the most recent read finished
+        self.NORMALIZED = array.array('f', [0]*self.NUM_SENSORS) # readings scaled from 0 (white) to 1 (black) by interpolate()
+        self._line_index = -1 # darkest sensor of the most recent read, -1 if no line was seen
+        self._roi_reads = 0 # ROI reads since the last full sweep
+        self.set_early_cutoff(early_cutoff)
 
-    def get_line_position(self):
+    def get_line_position(self, max_age=None):
         """
         Updates the line position using the internal update_line_position() function then returns the value
+        @param max_age: If given, the cached line position is returned without reading the sensors as long as it is
+                        no older than this many microseconds
         """
-        self.update_line_position()
+        if(max_age is None or time.ticks_diff(time.ticks_us(), self.TIMESTAMP) > max_age):
+            self.update_line_position()
 
         # Under normal operation value between -1 and 1. -1 is left, 1 is right
         # return 2 if all sensors are tripped (for finish detection)
@@ -139,21 +202,144 @@ class LineSensorArray:
         Negative values represent the line being to the left of the robot and Positive values represent the line being to the right.
         In the case that no line is detected, outputs 0.
         In the event that most of the sensors detect strongly (a horizontal line is detected), outputs 2
+        The readings are kept as integers in the preallocated READINGS buffer, so the only object this creates is the final position.
+        In ROI mode only the sensors around the last line position are read, unless a full sweep is needed.
         """
-        readings = []
-        readings_total = 0
-        for i in range(self.NUM_SENSORS):
-            sensor = self.SENSOR_LIST[i]
-            sensor_value = sensor.get_value()
-            modified_value = self.threshold_linear(sensor_value, i)
-            readings.append(modified_value) # holds values between 0 and 1
-            readings_total += modified_value
-            # print(f"Getting Sensor {i} value: {sensor_value}")
+        readings = self.READINGS
+        first = 0
+        last = self.NUM_SENSORS-1
+        if(self.ROI and self._line_index>=0 and self._roi_reads<self.ROI_FULL_PERIOD):
+            if(self._line_index-self.ROI_HALF_WIDTH>first):
+                first = self._line_index-self.ROI_HALF_WIDTH
+            if(self._line_index+self.ROI_HALF_WIDTH<last):
+                last = self._line_index+self.ROI_HALF_WIDTH
+        readings_total = self.read_range(first, last)
+
+        if(first>0 or last<self.NUM_SENSORS-1):
+            self._roi_reads += 1
+            index = self._line_index
+            # Do a full sweep if the line was lost, is at the edge of the region, or covers the whole region
+            if(index<0 or (index==first and first>0) or (index==last and last<self.NUM_SENSORS-1) 
+               or readings_total>=self.ALL_ON_LEVELS[last-first+1]):
+                readings_total = self.read_range(0, self.NUM_SENSORS-1)
+                self._roi_reads = 0
+        else:
+            self._roi_reads = 0
         
-        if(readings_total >= self.NUM_SENSORS*self.ALL_ON_PERCENT):
+        if(readings_total >= self.ALL_ON_LEVEL):
             self.LINE_POSITION = 2
+        elif(self.HIGH_RES):
+            self.LINE_POSITION = self.interpolate()
         else:
             self.LINE_POSITION = self.centroid(readings)
+        self.TIMESTAMP = time.ticks_us()
+
+    def read_range(self, first, last):
+        """
+        Reads the sensors from first to last (inclusive) and thresholds them into READINGS and VALUES.
+        Sensors outside of the range are recorded as 0 (no line).
+        Returns the sum of the thresholded readings in quarters.
+        @param first: Index of the first sensor to read
+        @param last: Index of the last sensor to read
+        """
+        self.acquire(first, last)
+        readings = self.READINGS
+        values = self.VALUES
+        readings_total = 0
+        darkest = -1
+        darkest_level = 0
+        for i in range(self.NUM_SENSORS):
+            if(i<first or i>last):
+                values[i] = 0
+                readings[i] = 0
+                continue
+            level = self.threshold_level(values[i], i)
+            readings[i] = level # holds values between 0 and 4 (quarters)
+            readings_total += level
+            if(level>darkest_level):
+                darkest_level = level
+                darkest = i
+            # print(f"Getting Sensor {i} value: {values[i]}")
+        self._line_index = darkest
+        return readings_total
+
+    def acquire(self, first, last):
+        """
+        Reads the raw decay times of the sensors from first to last (inclusive) into VALUES
+        @param first: Index of the first sensor to read
+        @param last: Index of the last sensor to read
+        """
+        if(self.PARALLEL_READ):
+            self.update_values_parallel(first, last)
+        values = self.VALUES
+        for i in range(first, last+1):
+            sensor = self.SENSOR_LIST[i]
+            if(not self.PARALLEL_READ):
+                sensor.update_value()
+            values[i] = sensor.VALUE
+
+    def sample(self, shares):
+        """
+        Generator task that reads the line sensor array once per run and publishes the result.
+        The raw readings of the same read are kept in VALUES and its time in TIMESTAMP.
+        @param shares: A tuple of a float share for the line position and an unsigned share for the ticks_us timestamp
+        """
+        position_share, time_share = shares
+        while 1:
+            self.update_line_position()
+            position_share.put(self.LINE_POSITION)
+            time_share.put(self.TIMESTAMP)
+            yield 0
+
+    def update_values_parallel(self, first=0, last=7):
+        """
+        Reads the LineSensor objects from first to last (all 8 by default) at once and stores each decay time in that sensor's VALUE parameter
+        Step 1: Turn all LEDs on
+        Step 2: Set every Value_Pin to an output and drive them all high for at least 10 microseconds
+        Step 3: Set every Value_Pin to an input and poll them in one loop, recording the time each one decays.
+                Decay times follow the same rules as LineSensor.update_value(), so both read modes give the same values.
+        Step 4: Turn all LEDs off
+        @param first: Index of the first sensor to read
+        @param last: Index of the last sensor to read
+        """
+        sensors = self.SENSOR_LIST
+        for i in range(first, last+1): # Step 1
+            sensors[i].LED_PIN.high()
+
+        for i in range(first, last+1): # Step 2
+            sensors[i].VALUE_PIN.init(Pin.OUT_PP)
+            sensors[i].VALUE_PIN.high()
+
+        # Waiting for 10 us
+        start = time.ticks_us()
+        deadline = time.ticks_add(start, 10) # add 10 usec interval
+        while(time.ticks_diff(deadline, time.ticks_us())>=0):
+            pass
+
+        done = self._done
+        for i in range(first, last+1): # Step 3
+            sensors[i].VALUE_PIN.init(Pin.IN)
+            sensors[i].VALUE = -1 # if a value stays at -1, it can be caught with an error later
+            done[i] = 0
+
+        # Waiting until every pin goes low or times out
+        start = time.ticks_us()
+        pending = last-first+1
+        while(pending>0):
+            decay_time = time.ticks_diff(time.ticks_us(), start) # one timestamp shared by every pin this pass
+            for i in range(first, last+1):
+                if(done[i]):
+                    continue
+                sensor = sensors[i]
+                if(sensor.VALUE_PIN.value()>0):
+                    sensor.VALUE = decay_time
+                    if(decay_time<sensor.CUTOFF): # if bigger than cutoff time, stop timing this pin
+                        continue
+                done[i] = 1
+                pending -= 1
+
+        for i in range(first, last+1): # Step 4
+            sensors[i].LED_PIN.low()
 
     def threshold_linear(self, sensor_reading, sensor):
         """
@@ -161,81 +347,110 @@ class LineSensorArray:
         @param sensor_reading: A LineSensor reading (values from 0-MAX_DECAY_TIME)
         @param sensor: the number of the sensor the reading came from. Used for specific calibration.
         """
-        if(sensor==0):
-            if(sensor_reading<600):
-                modified_reading = 0
-            elif(sensor_reading<1200):
-                modified_reading = 0.5
-            elif(sensor_reading<1800):
-                modified_reading = 0.75
-            else:
-                modified_reading = 1
-        elif(sensor==1):
-            if(sensor_reading<700):
-                modified_reading = 0
-            elif(sensor_reading<1200):
-                modified_reading = 0.5
-            elif(sensor_reading<1900):
-                modified_reading = 0.75
-            else:
-                modified_reading = 1
-        elif(sensor==2):
-            if(sensor_reading<600):
-                modified_reading = 0
-            elif(sensor_reading<1100):
-                modified_reading = 0.5
-            elif(sensor_reading<1700):
-                modified_reading = 0.75
-            else:
-                modified_reading = 1
-        elif(sensor==3):
-            if(sensor_reading<600):
-                modified_reading = 0
-            elif(sensor_reading<1100):
-                modified_reading = 0.5
-            elif(sensor_reading<1700):
-                modified_reading = 0.75
-            else:
-                modified_reading = 1
-        elif(sensor==4):
-            if(sensor_reading<700):
-                modified_reading = 0
-            elif(sensor_reading<1200):
-                modified_reading = 0.5
-            elif(sensor_reading<1600):
-                modified_reading = 0.75
-            else:
-                modified_reading = 1
-        elif(sensor==5):
-            if(sensor_reading<600):
-                modified_reading = 0
-            elif(sensor_reading<1000):
-                modified_reading = 0.5
-            elif(sensor_reading<1600):
-                modified_reading = 0.75
-            else:
-                modified_reading = 1
-        elif(sensor==6):
-            if(sensor_reading<600):
-                modified_reading = 0
-            elif(sensor_reading<1100):
-                modified_reading = 0.5
-            elif(sensor_reading<1900):
-                modified_reading = 0.75
-            else:
-                modified_reading = 1
-        elif(sensor==7):
-            if(sensor_reading<800):
-                modified_reading = 0
-            elif(sensor_reading<1300):
-                modified_reading = 0.5
-            elif(sensor_reading<1950):
-                modified_reading = 0.75
-            else:
-                modified_reading = 1
+        return self.threshold_level(sensor_reading, sensor)/4
+
+    def threshold_level(self, sensor_reading, sensor):
+        """
+        Returns the thresholded value in quarters (0, 2, 3, or 4 for 0, 0.5, 0.75, or 1) so it can be stored without allocating a float
+        @param sensor_reading: A LineSensor reading (values from 0-MAX_DECAY_TIME)
+        @param sensor: the number of the sensor the reading came from. Used for specific calibration.
+        """
+        index = sensor*3 # each sensor has 3 breakpoints in the THRESHOLDS table
+        thresholds = self.THRESHOLDS
+        if(sensor_reading<thresholds[index]):
+            return 0
+        elif(sensor_reading<thresholds[index+1]):
+            return 2
+        elif(sensor_reading<thresholds[index+2]):
+            return 3
+        return 4
+
+    def load_calibration(self, filename):
+        """
+        Loads the threshold table from a calibration file. If the file does not exist the current table is kept.
+        The file holds one line per sensor with its 3 breakpoints in microseconds separated by commas, e.g. "600,1200,1800".
+        A line may also carry the 4 third order linearization coefficients after the breakpoints, as written by lineCalibration.py
+        @param filename: Name of the calibration file
+        @return True if the file was loaded, False if it was not found
+        """
+        try:
+            with open(filename, "r") as file:
+                lines = [line.strip() for line in file if line.strip()]
+        except OSError:
+            return False
+
+        if(len(lines) != self.NUM_SENSORS):
+            raise ValueError("calibration file needs one line per sensor")
+        thresholds = array.array('H', self.THRESHOLDS)
+        coefficients = array.array('f', self.LINEAR_COEFFS)
+        for i in range(self.NUM_SENSORS):
+            fields = lines[i].split(",")
+            if(len(fields) != 3 and len(fields) != 7):
+                raise ValueError("calibration line needs 3 breakpoints and optionally 4 coefficients")
+            for j in range(3):
+                thresholds[i*3+j] = int(fields[j])
+            if(len(fields) == 7):
+                for j in range(4):
+                    coefficients[i*4+j] = float(fields[3+j])
+        self.THRESHOLDS = thresholds
+        self.LINEAR_COEFFS = coefficients
+        self.set_early_cutoff(self.EARLY_CUTOFF) # cutoffs follow the new breakpoints
+        return True
 
-        return modified_reading
+    def set_early_cutoff(self, enabled):
+        """
+        Sets the decay time at which each sensor stops timing.
+        When enabled, a sensor stops at its highest breakpoint in THRESHOLDS, because every longer decay thresholds to 1.
+        The raw VALUES are then capped at that breakpoint, so disable this when recording calibration data.
+        @param enabled: True to stop at the highest breakpoint, False to time up to MAX_DECAY_TIME
+        """
+        self.EARLY_CUTOFF = enabled
+        for i in range(self.NUM_SENSORS):
+            sensor = self.SENSOR_LIST[i]
+            if(enabled):
+                sensor.CUTOFF = min(sensor.MAX_DECAY_TIME, self.THRESHOLDS[i*3+2])
+            else:
+                sensor.CUTOFF = sensor.MAX_DECAY_TIME
     
+    def interpolate(self):
+        """
+        Estimates the line position from the continuous readings in VALUES with sub-sensor resolution.
+        Each reading is normalized between its sensor's lowest and highest breakpoint in THRESHOLDS, then a parabola is fit
+        through the darkest sensor and its two neighbors and the peak of the parabola is used as the line position.
+        Returns a value between -1 and 1, or 0 if no sensor sees the line.
+        """
+        values = self.VALUES
+        thresholds = self.THRESHOLDS
+        normalized = self.NORMALIZED
+        darkest = 0
+        for i in range(self.NUM_SENSORS):
+            low = thresholds[i*3]
+            high = thresholds[i*3+2]
+            level = (values[i]-low)/(high-low)
+            if(level<0): level = 0
+            if(level>1): level = 1
+            normalized[i] = level
+            if(level>normalized[darkest]):
+                darkest = i
+        
+        center = normalized[darkest]
+        if(center<=0): # no line detected
+            return 0
+        left = normalized[darkest-1] if darkest>0 else 0
+        right = normalized[darkest+1] if darkest<self.NUM_SENSORS-1 else 0
+        curvature = left-2*center+right
+        offset = 0
+        if(curvature<0):
+            offset = 0.5*(left-right)/curvature # vertex of the parabola through the 3 points
+            if(offset>0.5): offset = 0.5
+            if(offset<-0.5): offset = -0.5
+        
+        half_width = (self.NUM_SENSORS-1)/2
+        position = (darkest+offset-half_width)/half_width # normalized to be between -1 and 1
+        if(position>1): position = 1
+        if(position<-1): position = -1
+        return position
+
     def third_order(self, x, a, b, c, d):
         """
         NOTE: UNUSED
@@ -249,26 +464,11 @@ class LineSensorArray:
         """
         NOTE: UNUSED
         Linearizes the line sensor readings based on third order approximations of their calibration data.
-        Not fully implemented.
-        """
-        if(sensor==0):
-            linear_reading = self.third_order(value, 1.37*(10**(-6)), -5.72*(10**(-3)), 8.32, -2.72*(10**(3)))
-        elif(sensor==1):
-            linear_reading = self.third_order(value, 1.37*(10**(-6)), -5.72*(10**(-3)), 8.32, -2.72*(10**(3)))
-        elif(sensor==2):
-            linear_reading = self.third_order(value, 1.37*(10**(-6)), -5.72*(10**(-3)), 8.32, -2.72*(10**(3)))
-        elif(sensor==3):
-            linear_reading = self.third_order(value, 1.37*(10**(-6)), -5.72*(10**(-3)), 8.32, -2.72*(10**(3)))
-        elif(sensor==4):
-            linear_reading = self.third_order(value, 1.37*(10**(-6)), -5.72*(10**(-3)), 8.32, -2.72*(10**(3)))
-        elif(sensor==5):
-            linear_reading = self.third_order(value, 1.37*(10**(-6)), -5.72*(10**(-3)), 8.32, -2.72*(10**(3)))
-        elif(sensor==6):
-            linear_reading = self.third_order(value, 1.37*(10**(-6)), -5.72*(10**(-3)), 8.32, -2.72*(10**(3)))
-        elif(sensor==7):
-            linear_reading = self.third_order(value, 1.37*(10**(-6)), -5.72*(10**(-3)), 8.32, -2.72*(10**(3)))
-
-        return linear_reading
+        The coefficients come from LINEAR_COEFFS, which can be fit per sensor with lineCalibration.py.
+        """
+        index = sensor*4
+        coefficients = self.LINEAR_COEFFS
+        return self.third_order(value, coefficients[index], coefficients[index+1], coefficients[index+2], coefficients[index+3])
         
 
     def threshold(self, linear_reading):
@@ -292,17 +492,80 @@ class LineSensorArray:
     def centroid(self, readings):
         """
         Calculates the centroid of the readings by finding a weighted sum and dividing it by a regular sum of the readings
-        Returns a value between -1 and 1.
+        Returns a value between -1 and 1. The result does not depend on the scale of the readings.
         @param readings: an array of modified sensor readings
         """
         # returns the centroid of the readings 
+        # sensor positions are doubled (-7, -5, ... 7) so integer readings stay integers until the final division
         weighted_sum = 0
         sum = 0
         for i in range(self.NUM_SENSORS): 
-            weighted_sum += readings[i]*(i-(self.NUM_SENSORS-1)/2)
+            weighted_sum += readings[i]*(2*i-(self.NUM_SENSORS-1))
             sum += readings[i]
         
         if(sum>0):
-            return weighted_sum/(sum*3.5) # normalized to be between -1 and 1
+            return weighted_sum/(sum*(self.NUM_SENSORS-1)) # normalized to be between -1 and 1
         else:
             return 0
+
+
+class AnalogLineSensorArray(LineSensorArray):
+    '''!@brief Class for an array of analog line sensors (QTR-8A style) read with the ADC
+    '''
+    def __init__(self, LED_pin, Pin_list, timer=None, samples=1, high_res=False, roi=False):
+        """!
+        Initializes the AnalogLineSensorArray object by setting up an ADC for each sensor output.
+        Readings are scaled to the same 0-MAX_DECAY_TIME range as the RC sensors so that the same thresholding,
+        centroid, and finish line logic can be used. A calibration file for the analog sensors should be loaded
+        with load_calibration(), since the default thresholds are tuned for RC decay times.
+        @param LED_pin: Pin to control the LEDs of the sensor array, or None if they are always on
+        @param Pin_list: Ordered list of the analog output pins of the line sensor array
+        @param timer: Timer used to pace ADC.read_timed_multi(). If None, each channel is read with ADC.read()
+        @param samples: Number of samples averaged for each channel on every read
+        @param high_res: If True, the line position is interpolated from the continuous readings instead of using the centroid
+        @param roi: If True, only the sensors around the last line position are thresholded on most updates
+        """
+        self.LED_PIN = Pin(LED_pin, mode=Pin.OUT_PP) if LED_pin is not None else None
+        self.ADC_LIST = tuple(ADC(pin) for pin in Pin_list)
+        self.TIMER = timer
+        self.SAMPLES = samples
+        self.ADC_MAX = 4095 # 12 bit ADC
+        self.MAX_DECAY_TIME = 2000 # readings are scaled to the RC decay time range
+        # One preallocated sample buffer per channel for ADC.read_timed_multi()
+        self.BUFFERS = tuple(array.array('H', [0]*samples) for pin in Pin_list)
+        self.SENSOR_LIST = []
+        self._setup(False, high_res, roi, False)
+
+    def set_early_cutoff(self, enabled):
+        """
+        Analog reads do not wait on a decay, so there is nothing to cut off
+        """
+        self.EARLY_CUTOFF = False
+
+    def acquire(self, first, last):
+        """
+        Samples every channel with the ADC and stores the scaled average of each in VALUES.
+        All channels are sampled even in ROI mode, since one multi-channel read costs about the same.
+        @param first: Index of the first sensor needed
+        @param last: Index of the last sensor needed
+        """
+        if(self.LED_PIN is not None):
+            self.LED_PIN.high()
+        if(self.TIMER is not None):
+            ADC.read_timed_multi(self.ADC_LIST, self.BUFFERS, self.TIMER)
+        else:
+            for i in range(self.NUM_SENSORS):
+                buffer = self.BUFFERS[i]
+                for j in range(self.SAMPLES):
+                    buffer[j] = self.ADC_LIST[i].read()
+        if(self.LED_PIN is not None):
+            self.LED_PIN.low()
+
+        values = self.VALUES
+        scale = self.SAMPLES*self.ADC_MAX
+        for i in range(self.NUM_SENSORS):
+            buffer = self.BUFFERS[i]
+            total = 0
+            for j in range(self.SAMPLES):
+                total += buffer[j]
+            values[i] = total*self.MAX_DECAY_TIME//scale # darker surfaces give higher readings, like longer decay times
@@ -8,6 +8,10 @@
 #  direction of the motor. The @c set_duty method inputs the PWM signal for the 
 #  effort pin and the sign drives the DIR pin. @c enable and @c disable control the 
 #  control the enable pin. 
+#  The motor remembers the enable, direction, and PWM compare values it last wrote, and only writes to the
+#  hardware when one of them changes, since the controller sets all of them every update. The duty is
+#  quantized to the compare resolution of the PWM timer and written as a raw compare value with
+#  @c pulse_width. The @c writes and @c skips counters show how many hardware writes were made and avoided.
 # 
 #  @author Cole Sterba, Devon Bolt
 #  @date   2024-Nov-12 Approximate date of creation of file
@@ -33,7 +37,14 @@ import time
 
 class Romi_motor:
     '''!@brief Romi motor class for interfacing with the onboard motors'''
-    def __init__ (self, EN_Pin, Direction_Pin, Effort_Pin, PWM_tim, tim_channel):
+    def __init__ (self, EN_Pin, Direction_Pin, Effort_Pin, PWM_tim, tim_channel, raw_compare=True):
+        '''Constructs a motor
+        @param EN_Pin enable pin
+        @param Direction_Pin direction pin
+        @param Effort_Pin PWM effort pin
+        @param PWM_tim timer used for the PWM signal
+        @param tim_channel timer channel of the effort pin
+        @param raw_compare if True the PWM compare value is written with pulse_width, otherwise with pulse_width_percent'''
         self.ENABLE = Pin(EN_Pin, mode=Pin.OUT_PP)
         self.EFFORT = Pin(Effort_Pin, mode=Pin.OUT_PP)
         self.DIRECTION = Pin(Direction_Pin, mode=Pin.OUT_PP)
@@ -41,27 +52,60 @@ class Romi_motor:
         self.ENABLE.low()
         self.DIRECTION.low()
         self.PWM.pulse_width_percent(0)
+        self.COUNTS = PWM_tim.period() + 1 # compare value for 100% duty
+        self.raw_compare = raw_compare
+        self._enabled = False # last values written to the hardware
+        self._direction = 0
+        self._compare = 0
+        self.writes = 0 # hardware writes made
+        self.skips = 0 # hardware writes avoided because the value had not changed
         pass
 
     def set_duty (self, duty):
         '''Sets the duty cycle of the motor'''
         if (-100 <= duty < 0):
-            self.PWM.pulse_width_percent(-duty)
-            self.DIRECTION.low()
+            direction = 0
+            duty = -duty
         elif (0 <= duty <= 100):
-            self.PWM.pulse_width_percent(duty)
-            self.DIRECTION.high()
+            direction = 1
         else:
             raise ValueError
+        compare = int(duty*self.COUNTS/100 + 0.5) # quantized to the timer resolution
+        if compare != self._compare:
+            if self.raw_compare:
+                self.PWM.pulse_width(compare)
+            else:
+                self.PWM.pulse_width_percent(compare*100/self.COUNTS)
+            self._compare = compare
+            self.writes += 1
+        else:
+            self.skips += 1
+        if direction != self._direction:
+            if direction: self.DIRECTION.high()
+            else: self.DIRECTION.low()
+            self._direction = direction
+            self.writes += 1
+        else:
+            self.skips += 1
         pass
     def enable (self):
         '''Enables the motor (EN pin high)'''
+        if self._enabled:
+            self.skips += 1
+            return
         self.ENABLE.high()
+        self._enabled = True
+        self.writes += 1
         #print("enabled")
         pass
     def disable (self):
         '''Disables the motor (EN pin low)'''
+        if not self._enabled:
+            self.skips += 1
+            return
         self.ENABLE.low()
+        self._enabled = False
+        self.writes += 1
         #print("disabled")
         pass
 
@@ -0,0 +1,149 @@
+## @file autotune.py
+#  This file is the relay feedback auto-tuner for the wheel PI controllers, along with the functions
+#  which save and load the tuned gains
+#
+#  The @c RelayTuner runs a relay (bang-bang) experiment on one wheel with the Romi up on a stand. The
+#  motor first runs at a bias duty until the wheel settles, and the settled speed becomes the relay
+#  setpoint. The duty is then switched between the bias plus and minus the relay amplitude each time the
+#  wheel speed crosses the setpoint, which makes the wheel speed oscillate at the ultimate period of the
+#  motor. The speeds and sample times are stored in preallocated arrays, and once they are full the
+#  period and amplitude of the last few oscillations give the ultimate gain Ku = 4d/(pi*a) and period Tu.
+#  The Ziegler-Nichols PI rules then give Kp = 0.45 Ku and Ki = 0.54 Ku/Tu. The gains of each wheel are
+#  saved to a gains file on the Romi with @c save_gains, and @c main.py loads them at boot with @c load_gains.
+#
+#  @author Cole Sterba, Devon Bolt
+#  @date   2026-Oct-16 Approximate date of creation of file
+#  @copyright This program is copyright (c) 2024 by C Sterba and D Bolt and
+#             released under the GNU Public License, version 3.0.
+#
+#  It is intended for educational use only, but its use is not limited thereto.
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+
+import time
+import math
+import array
+
+class RelayTuner:
+    '''!@brief Relay feedback experiment which finds PI gains for one wheel controller'''
+
+    def __init__(self, controller, bias=40, amplitude=20, period=10, settle=100, samples=300):
+        '''!@brief Constructs a relay tuner
+        @param controller Wheel controller to tune, its motor and encoder are used for the experiment
+        @param bias % duty the relay switches around
+        @param amplitude % duty added to or taken from the bias by the relay
+        @param period Time between samples in ms
+        @param settle Number of samples run at the bias duty to find the setpoint
+        @param samples Number of samples recorded during the relay experiment
+        '''
+        self.controller = controller
+        self.motor = controller.motor
+        self.encoder = controller.encoder
+        self.bias = bias
+        self.amplitude = amplitude
+        self.period = period
+        self.settle = settle
+        self.SPEEDS = array.array('f', [0]*samples) # rad/s during the relay experiment
+        self.TIMES = array.array('l', [0]*samples) # ticks_us of each speed
+        self.setpoint = 0.0
+        self.Ku = None
+        self.Tu = None
+
+    def _sample(self):
+        '''Wait one period, then sample the encoder and return the wheel speed'''
+        time.sleep_ms(self.period)
+        self.encoder.sample()
+        return self.encoder.get_velocity()
+
+    def tune(self):
+        '''!@brief Runs the relay experiment, blocking for about (settle + samples) periods
+        @return Tuple of the Kp and Ki gains, or None if the wheel did not oscillate
+        '''
+        self.encoder.sample() # start the velocity window from now
+        self.motor.enable()
+        self.motor.set_duty(self.bias)
+        total = 0.0
+        for i in range(self.settle):
+            speed = self._sample()
+            if i >= self.settle//2: # average over the second half, once the wheel is up to speed
+                total += speed
+        self.setpoint = total/(self.settle - self.settle//2)
+        direction = 1 if self.setpoint >= 0 else -1 # sign of the speed for a positive duty
+
+        for i in range(len(self.SPEEDS)):
+            speed = self._sample()
+            self.SPEEDS[i] = speed
+            self.TIMES[i] = time.ticks_us()
+            if (speed - self.setpoint)*direction < 0:
+                self.motor.set_duty(self.bias + self.amplitude)
+            else:
+                self.motor.set_duty(self.bias - self.amplitude)
+        self.motor.set_duty(0)
+        self.motor.disable()
+        return self.analyze()
+
+    def analyze(self):
+        '''!@brief Finds the oscillation period and amplitude from the recorded speeds
+        @details The first half of the record is skipped, so the oscillation has settled
+        @return Tuple of the Kp and Ki gains, or None if there were fewer than 2 full oscillations
+        '''
+        speeds = self.SPEEDS
+        first_crossing = None
+        last_crossing = None
+        cycles = 0
+        high = -1e9
+        low = 1e9
+        for i in range(len(speeds)//2, len(speeds)):
+            if first_crossing is not None:
+                if speeds[i] > high: high = speeds[i]
+                if speeds[i] < low: low = speeds[i]
+            # Upward crossing of the setpoint
+            if speeds[i-1] < self.setpoint <= speeds[i]:
+                if first_crossing is None:
+                    first_crossing = i
+                else:
+                    cycles += 1
+                last_crossing = i
+        if cycles < 2 or high <= low:
+            return None
+        self.Tu = time.ticks_diff(self.TIMES[last_crossing], self.TIMES[first_crossing])/cycles/1_000_000 # s
+        a = (high - low)/2 # rad/s
+        self.Ku = 4*self.amplitude/(math.pi*a)
+        return 0.45*self.Ku, 0.54*self.Ku/self.Tu
+
+
+def save_gains(filename, gains):
+    '''!@brief Writes the gains of each wheel to the gains file
+    @param filename Name of the gains file
+    @param gains Dictionary of (Kp, Ki) tuples keyed by wheel name
+    '''
+    with open(filename, "w") as file:
+        for name in gains:
+            Kp, Ki = gains[name]
+            file.write(f"{name},{Kp},{Ki}\n")
+
+
+def load_gains(filename):
+    '''!@brief Reads the gains of each wheel from the gains file
+    @param filename Name of the gains file
+    @return Dictionary of (Kp, Ki) tuples keyed by wheel name, or None if there is no gains file
+    '''
+    gains = {}
+    try:
+        with open(filename, "r") as file:
+            for line in file:
+                fields = line.strip().split(",")
+                if len(fields) == 3:
+                    gains[fields[0]] = (float(fields[1]), float(fields[2]))
+    except OSError:
+        return None
+    return gains
@@ -5,8 +5,23 @@
 #  the @c run function is the main component of the controller class, which takes readings
 #  from the encoder as well as time passed to calculate proportional and integral error 
 #  over time. These errors are multiplied by their respective gains to get the output for 
-#  motor duty cycle. the @c setSpeed function allows the alteration of the desired speed from 
-#  which error is calculated.  
+#  motor duty cycle. The measured speed comes from @c Encoder.get_velocity(), which uses the
+#  timestamped encoder samples rather than assuming the encoder task ran exactly on period.
+#  the @c setSpeed function allows the alteration of the desired speed from which error is calculated.  
+#  The gains are set per controller and can be changed while running with @c set_gains. Along with the
+#  PI terms, the output has a velocity feedforward term and a static friction term which steps the duty
+#  past the deadband of the motor whenever it is asked to move. The integral only accumulates while the
+#  output is not saturated, or when the error would bring it back out of saturation, so it does not wind up.
+#  The @c DriveLoop class runs both wheels as one scheduler task, sampling both encoders back to back
+#  and then stepping both controllers, so the left and right speeds come from the same instant.
+#  @c DriveBase extends it to take a linear and an angular velocity for the whole robot, and adds a
+#  cross coupling term which speeds up the lagging wheel and slows the leading one whenever the
+#  difference between the wheel speeds drifts from the commanded difference.
+#  @c TimerDriveLoop runs the drive base from a hardware timer at a few hundred Hz instead. The timer
+#  interrupt only captures the encoder counters, which does not allocate memory, and defers the PI
+#  update to @c micropython.schedule so it runs between bytecodes of the scheduler tasks.
+#  @c MotionProfile plans trapezoidal moves of a set number of encoder ticks. The drive loop steps it
+#  every control update, and the state machine drives at its @c velocity until @c done() is True.
 # 
 #  @author Cole Sterba, Devon Bolt
 #  @date   2024-Nov-12 Approximate date of creation of file
@@ -30,41 +45,73 @@
 import time
 import pyb #type: ignore
 import utime #type: ignore
+import micropython #type: ignore
+import math
 
 class controller:
     """!@brief PI controller to drive the motors on the Romi Motor"""
 
-    def __init__ (self, motor, encoder,ENC_PERIOD):
+    def __init__ (self, motor, encoder,ENC_PERIOD,Kp=7,Ki=7,Kff=0,friction=0):
+        '''Construct a PI motor controller
+        @param motor Romi_motor to drive
+        @param encoder Encoder of the same wheel
+        @param ENC_PERIOD encoder update period in ms
+        @param Kp proportional gain in % duty per rad/s
+        @param Ki integral gain in % duty per rad
+        @param Kff feedforward gain in % duty per rad/s of desired speed
+        @param friction % duty added in the direction of the desired speed to overcome static friction'''
         self.motor = motor
         self.encoder = encoder
         self.motor.enable()
         self.ENC_PERIOD = ENC_PERIOD
         self.refSpeed = 0.0
+        self.measuredSpeed = 0.0
+        self.Kp = Kp #proportional motor gain
+        self.Ki = Ki #integral motor gain
+        self.Kff = Kff #feedforward gain
+        self.friction = friction #static friction compensation
+        self.integral_error = 0 #integral error
+
+    def step(self, offset=0):
+        '''Run one update of the PI motor controller using the latest encoder sample
+        @param offset correction in rad/s added to the desired speed for this update only'''
+        if(self.refSpeed == 0): 
+            self.motor.disable()
+            self.integral_error = 0 
+        else:
+            self.motor.enable()
+        self.measuredSpeed = self.encoder.get_velocity() # rad/s from the measured time between encoder samples
+        reference = self.refSpeed + offset
+        error = (reference - self.measuredSpeed)
+        L = self.Kp*error + self.Kff*reference #proportional and feedforward terms
+        if(self.refSpeed > 0): L += self.friction
+        elif(self.refSpeed < 0): L -= self.friction
+        integral_error = self.integral_error + error*self.encoder.get_dt()/1_000_000 # time between the encoder samples in s
+        # conditional integration, the integral is held while the output is saturated in the direction of the error
+        if not ((L + self.Ki*integral_error > 100 and error > 0) or (L + self.Ki*integral_error < -100 and error < 0)):
+            self.integral_error = integral_error
+        L += self.Ki*self.integral_error #proportional integral controller
+        if L > 100: L = 100
+        if L < -100: L = -100
+        self.motor.set_duty(L)
 
     def run(self):
         '''Run the PI motor controller using input from encoder'''
-        Kp = 7 #proportional motor gain
-        Ki = 7 #integral motor gain
-        integral_error = 0 #integral error
-        etime = utime.ticks_ms()
         while 1:
-            if(self.refSpeed == 0): 
-                self.motor.disable()
-                integral_error = 0 
-            else:
-                self.motor.enable()
-            stime = utime.ticks_ms()
-            timePassed = utime.ticks_diff(stime, etime)
-            etime = utime.ticks_ms()
-            self.measuredSpeed = self.encoder.get_delta()*4.3633/self.ENC_PERIOD #convert to rad/s
-            error = (self.refSpeed - self.measuredSpeed)
-            integral_error += error*float(timePassed/1000)
-            L = Kp*error + Ki*integral_error #proportional integral controller
-            if L > 100: L = 100
-            if L < -100: L = -100
-            self.motor.set_duty(L)
+            self.step()
             yield 0
     
+    def set_gains(self,Kp=None,Ki=None,Kff=None,friction=None):
+        '''Change the controller gains, any gain left as None keeps its value
+        @param Kp proportional gain in % duty per rad/s
+        @param Ki integral gain in % duty per rad
+        @param Kff feedforward gain in % duty per rad/s of desired speed
+        @param friction % duty added in the direction of the desired speed to overcome static friction'''
+        if(Kp is not None): self.Kp = Kp
+        if(Ki is not None): self.Ki = Ki
+        if(Kff is not None): self.Kff = Kff
+        if(friction is not None): self.friction = friction
+
     def setSpeed(self,desiredSpeed):
         '''Set the desired speed for the controller
         @param desiredSpeed the speed the motor should drive to'''
@@ -74,4 +121,184 @@ class controller:
         '''Return the raw encoder position from the encoder obj'''
         return self.encoder.get_position()
 
-        
\ No newline at end of file
+
+class MotionProfile:
+    """!@brief Trapezoidal velocity profile for moves of a set distance"""
+
+    def __init__(self, left_encoder, right_encoder, min_speed=2):
+        '''Construct a motion profile, the distance moved is the average of both wheels
+        @param left_encoder Encoder of the left wheel
+        @param right_encoder Encoder of the right wheel
+        @param min_speed slowest speed in rad/s the profile creeps at, so the end of the move is reached'''
+        self.left_encoder = left_encoder
+        self.right_encoder = right_encoder
+        self.min_speed = min_speed
+        self.RAD_PER_TICK = 2*math.pi/left_encoder.TICKS_PER_REV
+        self.velocity = 0.0 # rad/s setpoint, positive along the move
+        self._done = True
+
+    def _position(self):
+        '''Average position of the wheels in ticks'''
+        return (self.left_encoder.get_position() + self.right_encoder.get_position())/2
+
+    def move(self, ticks, vmax, accel):
+        '''Start a move, precomputing where the profile stops accelerating and starts slowing down
+        @param ticks distance of the move in encoder ticks, in either direction
+        @param vmax top wheel speed in rad/s
+        @param accel wheel acceleration in rad/s^2'''
+        self.distance = abs(ticks)*self.RAD_PER_TICK # wheel rotation in rad
+        self.accel = accel
+        # A short move never reaches vmax, so the profile is a triangle peaking halfway
+        self.peak = min(vmax, math.sqrt(accel*self.distance))
+        self.decel_start = self.distance - self.peak*self.peak/(2*accel)
+        self.start_position = self._position()
+        self.start_time = time.ticks_us()
+        self.velocity = self.min_speed
+        self._done = False
+
+    def step(self):
+        '''Update the velocity setpoint, called at the control rate'''
+        if self._done:
+            return
+        traveled = abs(self._position() - self.start_position)*self.RAD_PER_TICK
+        if traveled >= self.distance:
+            self._done = True
+            self.velocity = 0.0
+            return
+        if traveled < self.decel_start:
+            velocity = self.accel*time.ticks_diff(time.ticks_us(), self.start_time)/1_000_000
+            if velocity > self.peak: velocity = self.peak
+        else:
+            velocity = math.sqrt(2*self.accel*(self.distance - traveled))
+        if velocity < self.min_speed: velocity = self.min_speed
+        self.velocity = velocity
+
+    def done(self):
+        '''Return True once the move has covered its distance'''
+        return self._done
+
+    def stop(self):
+        '''Abandon the current move'''
+        self._done = True
+        self.velocity = 0.0
+
+
+class DriveLoop:
+    """!@brief Samples both wheel encoders and runs both PI controllers as one task"""
+
+    def __init__(self, left_controller, right_controller):
+        '''Construct a drive loop
+        @param left_controller controller of the left wheel
+        @param right_controller controller of the right wheel'''
+        self.left = left_controller
+        self.right = right_controller
+        self.profile = MotionProfile(left_controller.encoder, right_controller.encoder)
+
+    def sample(self):
+        '''Read both encoder counters back to back'''
+        self.left.encoder.sample()
+        self.right.encoder.sample()
+
+    def control(self):
+        '''Run one PI update for both wheels'''
+        self.profile.step()
+        self.left.step()
+        self.right.step()
+
+    def step(self):
+        '''Sample both encoders, then update both controllers'''
+        self.sample()
+        self.control()
+
+    def run(self):
+        '''Run the drive loop as a generator task, one step each time it is scheduled'''
+        while 1:
+            self.step()
+            yield 0
+
+
+class DriveBase(DriveLoop):
+    """!@brief Drive loop commanded with linear and angular velocity, holding the wheels in sync"""
+
+    def __init__(self, left_controller, right_controller, Kc=0.5):
+        '''Construct a drive base
+        @param left_controller controller of the left wheel
+        @param right_controller controller of the right wheel
+        @param Kc gain from the wheel speed difference error to the correction split between the wheels'''
+        super().__init__(left_controller, right_controller)
+        self.Kc = Kc
+
+    def set_velocity(self, v, w=0):
+        '''Set the desired motion of the robot, both wheels are updated together
+        @param v forward wheel speed in rad/s
+        @param w wheel speed in rad/s added to the left wheel and taken from the right wheel, positive turns clockwise'''
+        self.right.setSpeed(-(v-w))
+        self.left.setSpeed(-(v+w))
+
+    def control(self):
+        '''Run one PI update for both wheels with the cross coupling correction'''
+        self.profile.step()
+        left = self.left
+        right = self.right
+        # positive when the left wheel is ahead of the right wheel by more than it was commanded to be
+        sync_error = (left.encoder.get_velocity() - right.encoder.get_velocity()) - (left.refSpeed - right.refSpeed)
+        correction = self.Kc*sync_error/2
+        left.step(-correction)
+        right.step(correction)
+
+
+class TimerDriveLoop(DriveBase):
+    """!@brief Runs the drive base from a hardware timer instead of the scheduler"""
+
+    def __init__(self, left_controller, right_controller, timer, freq=500, left_speed=None, right_speed=None):
+        '''Construct a timer driven drive loop, call start() to begin running it
+        @param left_controller controller of the left wheel
+        @param right_controller controller of the right wheel
+        @param timer pyb.Timer which is not used by anything else
+        @param freq rate of the loop in Hz
+        @param left_speed optional float share the measured left wheel speed is put in
+        @param right_speed optional float share the measured right wheel speed is put in'''
+        super().__init__(left_controller, right_controller)
+        self.timer = timer
+        self.freq = freq
+        self.left_speed = left_speed
+        self.right_speed = right_speed
+        self._control_cb = self._control # bound once so the interrupt does not allocate
+        self._pending = False # a control update is scheduled and has not run yet
+        self.ticks = 0 # number of timer interrupts
+        self.overruns = 0 # interrupts where the previous control update had not run yet
+
+    def start(self):
+        '''Start the timer which runs the loop'''
+        self.timer.init(freq=self.freq)
+        self.timer.callback(self._isr)
+
+    def stop(self):
+        '''Stop the timer which runs the loop'''
+        self.timer.callback(None)
+
+    def _isr(self, tim):
+        '''Timer interrupt, captures both encoders and schedules the control update'''
+        self.left.encoder.capture()
+        self.right.encoder.capture()
+        self.ticks += 1
+        if self._pending:
+            self.overruns += 1
+            return
+        self._pending = True
+        try:
+            micropython.schedule(self._control_cb, 0)
+        except RuntimeError: # the schedule queue is full
+            self._pending = False
+            self.overruns += 1
+
+    def _control(self, arg):
+        '''Scheduled control update, runs outside of the interrupt so it can use floating point math'''
+        self._pending = False
+        self.left.encoder.update_velocity()
+        self.right.encoder.update_velocity()
+        self.control()
+        if self.left_speed is not None:
+            self.left_speed.put(self.left.measuredSpeed)
+        if self.right_speed is not None:
+            self.right_speed.put(self.right.measuredSpeed)
@@ -8,6 +8,11 @@
 #  the scheduler, allowing it to update every 20ms (can be changed). The @c get_delta function 
 #  returns the last increment made to the encoder. The @c get_position function returns the current
 #  position of the encoder. The @c zero function zeroes the position of the encoder. 
+#  Every counter sample is stamped with @c ticks_us, so @c get_velocity() divides by the true time between
+#  samples instead of the nominal task period and stays correct when the scheduler runs the task late.
+#  The velocity can be averaged over a moving window of the last few samples, kept in preallocated arrays.
+#  @c sample() is split into @c capture(), which only does integer math and can run in a timer interrupt,
+#  and @c update_velocity(), which does the floating point division.
 # 
 #  @author Cole Sterba, Devon Bolt
 #  @date   2024-Nov-12 Approximate date of creation of file
@@ -30,19 +35,25 @@
 
 from pyb import Pin, Timer #type: ignore
 import time
+import math
+import array
 
 class Encoder:
     '''!@brief Interface with quadrature encoders
     @details
     '''
 
-    def __init__(self, CHA_pin, CHB_pin, Enc_Timer):
+    TICKS_PER_REV = 1440 # encoder ticks per wheel revolution
+    RAD_PER_TICK = 2*math.pi/TICKS_PER_REV
+
+    def __init__(self, CHA_pin, CHB_pin, Enc_Timer, window=1):
         '''!@brief Constructs an encoder object
         @details
         @param CHA: 1st channel of the encoder output, changes state everytime the encoder passes by it
         @param CHB: 2nd channel of the encoder output, changes state everytime the encoder passes by it, 90 degrees out of phase with CHA
         @param TIM: timer to count the encoder ticks
         @param INT_TIM: Timer that instructs the object when to check for a new position
+        @param window: Number of samples the velocity is averaged over
         '''
         self.TIM = Enc_Timer 
         self.CHA = self.TIM.channel(1,pin=CHA_pin, mode=Enc_Timer.ENC_AB)
@@ -51,23 +62,66 @@ class Encoder:
         self.current_pos = 0 # This holds the current value of the encoder
         self.last_pos = 0
         self.delta = 0 # This is used by the update() method and tracks the difference between the current encoder reading and the previous one
+        self.timestamp = time.ticks_us() # ticks_us of the most recent sample
+        self.dt = 0 # us between the two most recent samples
+        self.velocity = 0.0 # rad/s averaged over the window
+        self._deltas = array.array('l', [0]*window) # ring buffers of the deltas and sample times in the window
+        self._dts = array.array('l', [0]*window)
+        self._index = 0
+        self._window_delta = 0 # sums of the ring buffers
+        self._window_dt = 0
 
-    def update(self, tim=None):
-        '''!@brief Updates encoder position and delta
+    def sample(self):
+        '''!@brief Reads the counter once and updates the position, delta, and velocity
         @details
         The delta describes the position of the encoder relative to the previously collected position
         '''
+        self.capture()
+        self.update_velocity()
+
+    def capture(self):
+        '''!@brief Reads the counter once and updates the position, delta, and velocity window
+        @details
+        Only integer math is done, so this does not allocate memory and can be called from an interrupt
+        '''
+        now = time.ticks_us()
+        self.last_pos = self.current_pos
+        self.current_pos = self.TIM.counter()
+        self.delta = self.current_pos - self.last_pos
+
+        if(self.delta>=32768):
+            self.delta-=65536
+        elif(self.delta<=-32768):
+            self.delta+=65536
+        
+        self.position+=self.delta
+        self.dt = time.ticks_diff(now, self.timestamp)
+        self.timestamp = now
+
+        # Replace the oldest sample in the window
+        index = self._index
+        self._window_delta += self.delta - self._deltas[index]
+        self._window_dt += self.dt - self._dts[index]
+        self._deltas[index] = self.delta
+        self._dts[index] = self.dt
+        index += 1
+        if index >= len(self._deltas):
+            index = 0
+        self._index = index
+
+    def update_velocity(self):
+        '''!@brief Recomputes the velocity from the samples in the window
+        @details
+        '''
+        if self._window_dt > 0:
+            self.velocity = self._window_delta*self.RAD_PER_TICK*1_000_000/self._window_dt
+
+    def update(self, tim=None):
+        '''!@brief Generator task that samples the encoder each time it is scheduled
+        @details
+        '''
         while 1:
-            self.last_pos = self.current_pos
-            self.current_pos = self.TIM.counter()
-            self.delta = self.current_pos - self.last_pos
-
-            if(self.delta>=32768):
-                self.delta-=65536
-            elif(self.delta<=-32768):
-                self.delta+=65536
-            
-            self.position+=self.delta
+            self.sample()
             yield 0
 
     def get_position(self):
@@ -84,6 +138,21 @@ class Encoder:
         '''
         return self.delta
 
+    def get_velocity(self):
+        '''!@brief Gets the wheel velocity from the most recent samples
+        @details
+        The velocity is the change in position over the window divided by the measured time it took
+        @return Velocity in rad/s, negative when driving forward
+        '''
+        return self.velocity
+
+    def get_dt(self):
+        '''!@brief Gets the time between the two most recent samples
+        @details
+        @return Time in us
+        '''
+        return self.dt
+
     def zero(self):
         '''!@brief Resets the encoder position to zero
         @details
@@ -0,0 +1,92 @@
+## @file headingEstimator.py
+#  This file is the Romi Robot heading estimator, which fuses wheel encoder odometry with the
+#  absolute heading from the IMU
+#
+#  The @c run function runs as a generator task in the scheduler at the control rate. Each run it
+#  propagates the heading from the difference between the left and right encoder position changes,
+#  which is available every period without any I2C traffic. Every @c correction_period runs the
+#  estimate is pulled toward the absolute IMU heading by a complementary filter gain, which removes
+#  the drift from wheel slip. The estimate is published in degrees (0 to 360, clockwise positive
+#  like the IMU) to a share so that @c statemachine.headingControl() can use a fresh heading without
+#  reading the IMU every tick. When the IMU is on an I2C bus manager, the snapshot for each correction
+#  is queued one run ahead so the bus task reads it and this task does not wait on the bus.
+#
+#  @author Cole Sterba, Devon Bolt
+#  @date   2026-Oct-16 Approximate date of creation of file
+#  @copyright This program is copyright (c) 2024 by C Sterba and D Bolt and
+#             released under the GNU Public License, version 3.0.
+#
+#  It is intended for educational use only, but its use is not limited thereto.
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+
+class HeadingEstimator:
+    '''!@brief Complementary filter heading estimator using the wheel encoders and the IMU'''
+
+    WHEEL_RADIUS = 35 # mm
+    TRACK_WIDTH = 141 # mm, distance between the wheels
+    TICKS_PER_REV = 1440 # encoder ticks per wheel revolution
+
+    def __init__(self, left_encoder, right_encoder, imu, correction_period=5, gain=0.2):
+        '''!@brief Constructs a heading estimator
+        @param left_encoder Encoder object of the left wheel
+        @param right_encoder Encoder object of the right wheel
+        @param imu BNO055 object giving the absolute heading
+        @param correction_period Number of runs between corrections against the IMU heading
+        @param gain Fraction of the heading error to the IMU removed at each correction (0 to 1)
+        '''
+        self.left_encoder = left_encoder
+        self.right_encoder = right_encoder
+        self.imu = imu
+        self.correction_period = correction_period
+        self.gain = gain
+        # heading change in degrees for one tick of difference between the wheels
+        self.DEGREES_PER_TICK = 360/self.TICKS_PER_REV*self.WHEEL_RADIUS/self.TRACK_WIDTH
+        self.heading = 0.0
+
+    def run(self, shares):
+        '''!@brief Generator task that updates the heading estimate and puts it in the heading share
+        @param shares A tuple holding the float share the heading is published to
+        '''
+        heading_share, = shares
+        while not self.imu.initialized: # the IMU heading is not valid until it finishes booting
+            yield 0
+        heading = self.imu.get_heading()
+        last_left = self.left_encoder.get_position()
+        last_right = self.right_encoder.get_position()
+        runs = 0
+        requested = False
+        while 1:
+            left = self.left_encoder.get_position()
+            right = self.right_encoder.get_position()
+            # Forward is negative encoder ticks, so the left wheel gaining ticks on the right wheel turns clockwise
+            heading += ((right-last_right) - (left-last_left))*self.DEGREES_PER_TICK
+            last_left = left
+            last_right = right
+
+            runs += 1
+            if(runs == self.correction_period - 1):
+                requested = self.imu.request_snapshot()
+            elif(runs >= self.correction_period):
+                runs = 0
+                if requested and self.imu.snapshot_request is None: # the bus task has read the queued snapshot
+                    imu_heading = self.imu.DATA[self.imu.HEADING]
+                else:
+                    imu_heading = self.imu.get_heading()
+                requested = False
+                heading += self.gain*self.imu.wrap_angle(imu_heading - heading)
+
+            if(heading >= 360): heading -= 360
+            if(heading < 0): heading += 360
+            self.heading = heading
+            heading_share.put(heading)
+            yield 0
@@ -0,0 +1,204 @@
+## @file i2cManager.py
+#  This file is the I2C bus manager, which owns an I2C bus and runs the transactions of every
+#  device driver on it
+#
+#  Drivers can use the manager in place of a @c pyb.I2C object, since its @c mem_read and @c mem_write
+#  methods take the same arguments and run the transaction right away. Drivers which do not need a
+#  result immediately can instead queue transactions with @c submit_read and @c submit_write. The
+#  @c run function runs as a generator task in the scheduler and drains the queue in priority order.
+#  Queued reads of the same device whose register ranges touch or overlap are coalesced into a single
+#  burst read, and the data is copied into the preallocated buffer of each request. Request slots are
+#  preallocated as well, so queueing a transaction does not allocate memory. The manager counts the
+#  transactions of each device and the total time the bus was busy, which can be printed for profiling.
+#
+#  @author Cole Sterba, Devon Bolt
+#  @date   2026-Oct-16 Approximate date of creation of file
+#  @copyright This program is copyright (c) 2024 by C Sterba and D Bolt and
+#             released under the GNU Public License, version 3.0.
+#
+#  It is intended for educational use only, but its use is not limited thereto.
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+
+import time
+from pyb import I2C # type: ignore
+
+class I2CRequest:
+    '''!@brief One queued I2C transaction'''
+    def __init__(self):
+        self.addr = 0
+        self.reg = 0
+        self.buf = None # buffer filled by a read, or data sent by a write
+        self.is_read = True
+        self.priority = 0
+        self.callback = None # called with the request when it is done
+        self.done = True
+
+
+class I2CManager:
+    '''!@brief Owns an I2C bus and runs queued, prioritized transactions on it'''
+    def __init__(self, i2c_bus, baudrate=400000, max_requests=8, burst_len=32):
+        '''!@brief Constructs an I2C bus manager
+        @param i2c_bus Number of the I2C bus to manage
+        @param baudrate Bus clock rate in Hz
+        @param max_requests Number of transactions that can be queued at once
+        @param burst_len Longest coalesced burst read in bytes
+        '''
+        self.i2c = I2C(i2c_bus, I2C.MASTER)
+        self.i2c.init(I2C.MASTER, baudrate=baudrate)
+        self._free = [I2CRequest() for i in range(max_requests)] # preallocated request slots
+        self._pending = []
+        self._scratch = bytearray(burst_len) # buffer for coalesced burst reads
+        self._scratch_view = memoryview(self._scratch)
+        self.transactions = {} # number of bus transactions for each device address
+        self.requests = 0 # number of queued requests completed, more than the queued transactions when reads are coalesced
+        self.busy_us = 0 # total time spent in bus transactions
+
+    def _count(self, addr, start):
+        '''Record a bus transaction to a device that started at the given ticks_us'''
+        self.busy_us += time.ticks_diff(time.ticks_us(), start)
+        self.transactions[addr] = self.transactions.get(addr, 0) + 1
+
+    def mem_read(self, data, addr, memaddr):
+        '''!@brief Read device registers right away, with the same arguments as pyb.I2C.mem_read
+        @param data Number of bytes to read, or a buffer to read into
+        @param addr Device address
+        @param memaddr First register to read
+        @return The data read
+        '''
+        start = time.ticks_us()
+        data = self.i2c.mem_read(data, addr, memaddr)
+        self._count(addr, start)
+        return data
+
+    def mem_write(self, data, addr, memaddr):
+        '''!@brief Write device registers right away, with the same arguments as pyb.I2C.mem_write
+        @param data Byte value or buffer to write
+        @param addr Device address
+        @param memaddr First register to write
+        '''
+        start = time.ticks_us()
+        self.i2c.mem_write(data, addr, memaddr)
+        self._count(addr, start)
+
+    def _submit(self, addr, reg, buf, is_read, priority, callback):
+        '''Fill a free request slot and queue it, returns None if every slot is in use'''
+        if not self._free:
+            return None
+        request = self._free.pop()
+        request.addr = addr
+        request.reg = reg
+        request.buf = buf
+        request.is_read = is_read
+        request.priority = priority
+        request.callback = callback
+        request.done = False
+        self._pending.append(request)
+        return request
+
+    def submit_read(self, addr, reg, buf, priority=0, callback=None):
+        '''!@brief Queue a read of len(buf) registers into buf
+        @param addr Device address
+        @param reg First register to read
+        @param buf Preallocated buffer the registers are read into
+        @param priority Higher priority requests are run first
+        @param callback Function called with the request once buf holds the data
+        @return The queued request, whose done flag is set when it finishes, or None if the queue is full
+        '''
+        return self._submit(addr, reg, buf, True, priority, callback)
+
+    def submit_write(self, addr, reg, data, priority=0, callback=None):
+        '''!@brief Queue a write of data to consecutive registers
+        @param addr Device address
+        @param reg First register to write
+        @param data Buffer holding the data to write. It must not change until the request is done
+        @param priority Higher priority requests are run first
+        @param callback Function called with the request once it is written
+        @return The queued request, whose done flag is set when it finishes, or None if the queue is full
+        '''
+        return self._submit(addr, reg, data, False, priority, callback)
+
+    def _finish(self, index):
+        '''Remove a request from the queue, mark it done, and call its callback'''
+        request = self._pending.pop(index)
+        request.done = True
+        self.requests += 1
+        if request.callback is not None:
+            request.callback(request)
+        request.buf = None
+        request.callback = None
+        self._free.append(request)
+
+    def process(self):
+        '''!@brief Run every queued transaction, highest priority first
+        @details Reads of the same device whose register ranges touch or overlap are run as one burst read.
+        Requests with equal priority are run in the order they were queued.
+        '''
+        pending = self._pending
+        while pending:
+            head = pending[0]
+            for request in pending:
+                if request.priority > head.priority:
+                    head = request
+
+            if not head.is_read:
+                start = time.ticks_us()
+                self.i2c.mem_write(head.buf, head.addr, head.reg)
+                self._count(head.addr, start)
+                self._finish(pending.index(head))
+                continue
+
+            # Grow the burst over every read of this device that touches it, up to the scratch buffer length
+            first = head.reg
+            end = head.reg + len(head.buf)
+            grown = True
+            while grown:
+                grown = False
+                for request in pending:
+                    if request.is_read and request.addr == head.addr:
+                        new_first = min(first, request.reg)
+                        new_end = max(end, request.reg + len(request.buf))
+                        if (request.reg <= end and request.reg + len(request.buf) >= first
+                            and new_end - new_first <= len(self._scratch) and (new_first != first or new_end != end)):
+                            first = new_first
+                            end = new_end
+                            grown = True
+
+            start = time.ticks_us()
+            self.i2c.mem_read(self._scratch_view[0:end-first], head.addr, first)
+            self._count(head.addr, start)
+
+            # Copy the burst into every read it covers
+            index = len(pending) - 1
+            while index >= 0:
+                request = pending[index]
+                if (request.is_read and request.addr == head.addr
+                    and request.reg >= first and request.reg + len(request.buf) <= end):
+                    offset = request.reg - first
+                    buf = request.buf
+                    for i in range(len(buf)):
+                        buf[i] = self._scratch[offset + i]
+                    self._finish(index)
+                index -= 1
+
+    def run(self):
+        '''!@brief Generator task that runs the queued transactions each time it is scheduled'''
+        while 1:
+            self.process()
+            yield 0
+
+    def __repr__(self):
+        '''!@brief Diagnostic printout of the transaction counts and bus busy time'''
+        rst = f"I2C bus: {self.requests} queued requests, {self.busy_us/1000:.1f} ms busy\n"
+        for addr in self.transactions:
+            rst += f"  device 0x{addr:02X}: {self.transactions[addr]} transactions\n"
+        return rst
@@ -0,0 +1,123 @@
+## @file lineCalibration.py
+#  This file is the offline line sensor calibration fitter. It runs on a host computer with NumPy,
+#  not on the Romi.
+#
+#  The fitter reads a CSV file of recorded calibration sweeps with one row per reading: the sensor index,
+#  the reflectance of the surface under the sensor in percent (100 being white), and the measured decay time
+#  in microseconds. For every sensor a third order polynomial is fit from decay time to a linearized reading
+#  on the 0 to MAX_DECAY_TIME scale using least squares. The breakpoints between the 0, 0.5, 0.75, and 1
+#  thresholded readings are then placed where the fitted curve crosses the midpoints between those levels.
+#  The fit error of each sensor is reported and a calibration file is written in the format loaded by
+#  @c LineSensorArray.load_calibration() at boot.
+#
+#  @b Example:
+#    @code
+#       python lineCalibration.py sweep.csv -o LINE_CAL_DATA.txt
+#    @endcode
+#
+#  @author Cole Sterba, Devon Bolt
+#  @date   2026-Oct-16 Approximate date of creation of file
+#  @copyright This program is copyright (c) 2024 by C Sterba and D Bolt and
+#             released under the GNU Public License, version 3.0.
+#
+#  It is intended for educational use only, but its use is not limited thereto.
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+
+import argparse
+import numpy as np
+
+NUM_SENSORS = 8
+MAX_DECAY_TIME = 2000 # us, matches LineSensor.MAX_DECAY_TIME
+LEVELS = np.array([0, 0.5, 0.75, 1]) # thresholded readings produced by LineSensorArray.threshold_linear()
+
+
+def load_sweeps(filename):
+    '''Load recorded calibration sweeps from a CSV file
+    @param filename CSV file with sensor, reflectance (percent), and decay time (us) columns. A header row is allowed
+    @return Arrays of sensor indices, reflectances, and decay times'''
+    data = np.genfromtxt(filename, delimiter=",", comments="#")
+    data = data[~np.isnan(data).any(axis=1)] # drops a header row if there is one
+    return data[:,0].astype(int), data[:,1], data[:,2]
+
+
+def fit_sensor(decay, reflectance):
+    '''Fit a third order linearization and the threshold breakpoints for one sensor
+    @param decay Decay times in us measured by the sensor
+    @param reflectance Surface reflectance in percent for each decay time
+    @return Tuple of the breakpoints, the coefficients (a, b, c, d), and the RMS fit error'''
+    target = (100 - reflectance)/100*MAX_DECAY_TIME # linearized reading, black is MAX_DECAY_TIME
+    vander = np.vander(decay, 4) # columns x^3, x^2, x, 1
+    coefficients, _, _, _ = np.linalg.lstsq(vander, target, rcond=None)
+    rms = np.sqrt(np.mean((vander @ coefficients - target)**2))
+
+    # Each breakpoint is the first decay time where the fit crosses the midpoint between two levels
+    grid = np.arange(MAX_DECAY_TIME + 1)
+    fitted = np.polyval(coefficients, grid)
+    midpoints = (LEVELS[:-1] + LEVELS[1:])/2*MAX_DECAY_TIME
+    crossed = fitted[None,:] >= midpoints[:,None]
+    breakpoints = np.where(crossed.any(axis=1), crossed.argmax(axis=1), MAX_DECAY_TIME)
+    breakpoints = np.maximum.accumulate(breakpoints) # keep the breakpoints in order
+    return breakpoints, coefficients, rms
+
+
+def level_accuracy(decay, reflectance, breakpoints):
+    '''Fraction of readings that threshold to the level nearest their true reflectance
+    @param decay Decay times in us measured by the sensor
+    @param reflectance Surface reflectance in percent for each decay time
+    @param breakpoints The 3 breakpoints of the sensor
+    @return Fraction of matching readings'''
+    measured = LEVELS[np.searchsorted(breakpoints, decay, side="right")]
+    darkness = (100 - reflectance)/100
+    expected = LEVELS[np.abs(darkness[:,None] - LEVELS[None,:]).argmin(axis=1)]
+    return np.mean(measured == expected)
+
+
+def fit_all(sensors, reflectance, decay):
+    '''Fit every sensor in the sweep data
+    @param sensors Sensor index of each reading
+    @param reflectance Surface reflectance in percent of each reading
+    @param decay Decay time in us of each reading
+    @return List of (breakpoints, coefficients, rms, accuracy) tuples, one per sensor'''
+    results = []
+    for sensor in range(NUM_SENSORS):
+        mask = sensors == sensor
+        if np.count_nonzero(mask) < 4:
+            raise ValueError(f"sensor {sensor} needs at least 4 readings for a third order fit")
+        breakpoints, coefficients, rms = fit_sensor(decay[mask], reflectance[mask])
+        accuracy = level_accuracy(decay[mask], reflectance[mask], breakpoints)
+        results.append((breakpoints, coefficients, rms, accuracy))
+    return results
+
+
+def write_calibration(filename, results):
+    '''Write the calibration file loaded by LineSensorArray.load_calibration()
+    @param filename Name of the calibration file
+    @param results Fit results from fit_all()'''
+    with open(filename, "w") as file:
+        for breakpoints, coefficients, rms, accuracy in results:
+            fields = [str(int(value)) for value in breakpoints] + [f"{value:.6g}" for value in coefficients]
+            file.write(",".join(fields) + "\n")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fit line sensor calibration from recorded sweeps")
+    parser.add_argument("sweeps", help="CSV file of sensor, reflectance (percent), decay time (us) rows")
+    parser.add_argument("-o", "--output", default="LINE_CAL_DATA.txt", help="calibration file to write")
+    args = parser.parse_args()
+
+    results = fit_all(*load_sweeps(args.sweeps))
+    print("SENSOR  BREAKPOINTS (us)      RMS ERROR  LEVEL ACCURACY")
+    for sensor, (breakpoints, coefficients, rms, accuracy) in enumerate(results):
+        print(f"{sensor:6d}  {breakpoints[0]:5d} {breakpoints[1]:5d} {breakpoints[2]:5d}  {rms:10.1f}  {accuracy:13.1%}")
+    write_calibration(args.output, results)
+    print(f"Wrote {args.output}")
@@ -7,8 +7,9 @@
 #  8 IR sensors, a 6 sensor bump sensor array, and 1 IMU are instantiated in this file. 
 #  The details of each of these objects is detailed in their respective files
 #  These objects are all intregated into a set of tasks which run on the scheduler.
-#  These tasks are: The overacrching Finite State Machine, updating the encoder positions,
-#  and running the individual motor controllers 
+#  These tasks are: The overacrching Finite State Machine, the drive loop that samples both encoders
+#  and runs both motor controllers, sampling the line sensor array, estimating heading, and
+#  tracking the pose of the robot with odometry
 # 
 #  @author Cole Sterba, Devon Bolt
 #  @date   2024-Nov-25 Approximate date of creation of file
@@ -36,10 +37,14 @@ import gc
 
 from encoder import Encoder
 from Romi_motor import Romi_motor
-from controller import controller
+from controller import controller, DriveBase, TimerDriveLoop
 from statemachine import statemachine
 from obstacleDetection import ObstacleDetection
 from LineSensor import LineSensorArray
+from headingEstimator import HeadingEstimator
+from odometry import Odometry
+from autotune import RelayTuner, save_gains, load_gains
+from i2cManager import I2CManager
 
 import cotask
 import task_share 
@@ -54,11 +59,24 @@ micropython.alloc_emergency_exception_buf(100)
 ENCPERIOD = 20 #ms
 CONTPERIOD = 20 #ms
 FSMPERIOD = 40 #ms
+LINEPERIOD = 40 #ms
+IMUBOOTPERIOD = 10 #ms
+HEADINGPERIOD = 20 #ms
+I2CPERIOD = 10 #ms
+TIMER_DRIVE = False # run the drive loop from a hardware timer instead of the scheduler
+DRIVEFREQ = 500 #Hz, rate of the timer driven drive loop
+AUTOTUNE = False # relay tune both wheel controllers at boot and save the gains, with the Romi on a stand
+GAINS_FILE = "GAINS.txt" # per robot wheel controller gains, written by the auto-tuner
 #Shares
 buttonStatus = task_share.Share("H",name="button status",thread_protect = True)
 initialHeading = task_share.Share("H",name="initial heading",thread_protect = True)
 currentHeading = task_share.Share("H",name="current heading",thread_protect=True)
-#position shares? maybe a list of all 3 values?
+linePosition = task_share.Share("f",name="line position",thread_protect=True)
+lineTime = task_share.Share("L",name="line time",thread_protect=True)
+fusedHeading = task_share.Share("f",name="fused heading",thread_protect=True)
+leftSpeed = task_share.Share("f",name="left speed",thread_protect=True)
+rightSpeed = task_share.Share("f",name="right speed",thread_protect=True)
+pose = task_share.ArrayShare("f",3,name="pose",thread_protect=True) # x (mm), y (mm), heading (degrees) from odometry
 
 def test_imu(imu):
     '''Function to test output of IMU, unused in final sprogram
@@ -84,27 +102,40 @@ def test_imu(imu):
         time.sleep(0.1)
 
 def read_imu_cal(imu):
-    '''Read IMU calibration data from the sensor and write to a .txt file
+    '''Read IMU calibration data from the sensor and write to a binary file
     @param imu IMU object to interact with'''
-    data = imu.read_calibration_data()  # reading calibration data from imu into array
+    blob = imu.read_calibration_blob()  # calibration data with a version and checksum header
 
-    with open("IMU_CAL_DATA.txt", "w") as file:
-        for item in data:
-            #print(f"{item}")
-            file.write(f"{item}\n")  # Write each item followed by a newline
+    with open("IMU_CAL_DATA.bin", "wb") as file:
+        file.write(blob)
+
+def load_imu_cal(imu):
+    '''Load IMU calibration data from the binary file, or from the older .txt file if there is no binary file
+    @param imu IMU object used to pack the .txt data into a calibration blob
+    @return The calibration blob, or None if there is no calibration file'''
+    try:
+        with open("IMU_CAL_DATA.bin", "rb") as file:
+            return file.read()
+    except OSError:
+        pass
 
-def write_imu_cal(imu):
-    '''Write IMU calibration data from a .txt file to the sensor
-    @param imu IMU object to interact with'''
     # Read the data from the file
     data = []
-    with open("IMU_CAL_DATA.txt", "r") as file:
-        for line in file:
-            #print(f"{line}")
-            data.append(line.strip())  
-    
-    # write to the IMU
-    imu.write_calibration_data(data)
+    try:
+        with open("IMU_CAL_DATA.txt", "r") as file:
+            for line in file:
+                #print(f"{line}")
+                data.append(line.strip())  
+    except OSError:
+        return None
+    return imu.pack_calibration_blob(data)
+
+def write_imu_cal(imu):
+    '''Write IMU calibration data from the calibration file to the sensor, blocking until done
+    @param imu IMU object to interact with'''
+    blob = load_imu_cal(imu)
+    if blob is not None and not imu.write_calibration_blob(blob):
+        print("IMU did not accept calibration data")
 
 
 def updateButton(pin):
@@ -115,6 +146,11 @@ def updateButton(pin):
 
 if __name__ == '__main__':
 
+    # Initializing IMU first, so that it settles while the rest of the hardware is set up
+    i2c_bus = I2CManager(1, baudrate=400000) # owns I2C bus 1 and queues the transactions of every device on it
+    imu = BNO055(i2c_bus, max_age=10_000, blocking=False) # reuse IMU readings for up to 10 ms
+    imuCalibration = load_imu_cal(imu)
+
     # Initializing Motors
     tim_3 = pyb.Timer(3, freq = 20_000) # sets up timer 3 for the right motor
     tim_4 = pyb.Timer(4, freq = 20_000) # sets up timer 4 for the left motor
@@ -124,12 +160,35 @@ if __name__ == '__main__':
     # Initializing Encoders
     tim_1 = pyb.Timer(1,period=65535,prescaler=0)
     tim_2 = pyb.Timer(2,period=65535,prescaler=0)
-    left_Encoder = Encoder(pyb.Pin.cpu.A8, pyb.Pin.cpu.A9, tim_1) # channel A, channel B, timer
-    right_Encoder = Encoder(pyb.Pin.cpu.A0, pyb.Pin.cpu.A1,tim_2) # channel A, channel B, timer
+    # The timer driven loop samples faster, so its velocity is averaged over the same 20 ms as the scheduled loop
+    window = DRIVEFREQ*CONTPERIOD//1000 if TIMER_DRIVE else 1
+    left_Encoder = Encoder(pyb.Pin.cpu.A8, pyb.Pin.cpu.A9, tim_1, window) # channel A, channel B, timer, velocity window
+    right_Encoder = Encoder(pyb.Pin.cpu.A0, pyb.Pin.cpu.A1,tim_2, window) # channel A, channel B, timer, velocity window
 
     # Initializing Controllers
     left_Controller = controller(left_Motor,left_Encoder,ENCPERIOD)
     right_Controller = controller(right_Motor,right_Encoder,ENCPERIOD)
+    wheelControllers = {"left": left_Controller, "right": right_Controller}
+    if AUTOTUNE:
+        gains = {}
+        for name in wheelControllers:
+            result = RelayTuner(wheelControllers[name]).tune()
+            if result is None:
+                print(f"Auto-tune of the {name} wheel found no oscillation, keeping its gains")
+            else:
+                gains[name] = result
+                print(f"Auto-tuned {name} wheel: Kp = {result[0]:.2f}, Ki = {result[1]:.2f}")
+        if gains:
+            save_gains(GAINS_FILE, gains)
+    gains = load_gains(GAINS_FILE) # keeps the built in gains if there is no gains file
+    if gains is not None:
+        for name in gains:
+            if name in wheelControllers:
+                wheelControllers[name].set_gains(*gains[name])
+    if TIMER_DRIVE:
+        driveLoop = TimerDriveLoop(left_Controller,right_Controller,pyb.Timer(7),DRIVEFREQ,leftSpeed,rightSpeed)
+    else:
+        driveLoop = DriveBase(left_Controller,right_Controller,Kc=0.5)
 
     # Initializing Button
     button = pyb.ExtInt(pyb.Pin.cpu.C13, pyb.ExtInt.IRQ_FALLING, pyb.Pin.PULL_NONE, updateButton)
@@ -144,19 +203,26 @@ if __name__ == '__main__':
                                  pyb.Pin.cpu.B13, 
                                  pyb.Pin.cpu.B14, 
                                  pyb.Pin.cpu.B15, 
-                                 pyb.Pin.cpu.B1])
+                                 pyb.Pin.cpu.B1],
+                                parallel_read=True,
+                                roi=True,
+                                early_cutoff=True)
+    lineArray.load_calibration("LINE_CAL_DATA.txt") # keeps the built in thresholds if there is no calibration file
 
     # Initializing Bump Sensor Pins: 
     obstacleDetector = ObstacleDetection([pyb.Pin.cpu.A5,  pyb.Pin.cpu.A6,  pyb.Pin.cpu.A7, 
                                           pyb.Pin.cpu.C5, pyb.Pin.cpu.B11, pyb.Pin.cpu.B12])
 
-    # Initializing IMU
-    i2c_bus = 1
-    imu = BNO055(i2c_bus)
-    write_imu_cal(imu) 
-    
+    # Initializing heading estimator, corrected against the IMU every 5 runs (100 ms)
+    headingEstimator = HeadingEstimator(left_Encoder,right_Encoder,imu,correction_period=5,gain=0.2)
+
+    # Initializing odometry, using the fused heading
+    odometry = Odometry(left_Encoder,right_Encoder,heading_share=fusedHeading)
+
     # Initializing state machine
-    romi_obj = statemachine(left_Controller,right_Controller,imu,buttonStatus,lineArray,obstacleDetector)
+    romi_obj = statemachine(left_Controller,right_Controller,imu,buttonStatus,lineArray,obstacleDetector,
+                            headingShare=fusedHeading,odometry=odometry,poseShare=pose,
+                            driveBase=driveLoop)
 
     #zero encoders
     left_Encoder.zero()
@@ -165,25 +231,37 @@ if __name__ == '__main__':
     #test_imu(imu)
 
     #Create tasks with generator functions
-    UpdateLeftEncoderTask = cotask.Task(left_Encoder.update,name="Update Left Encoder", priority=1, period=ENCPERIOD,
-                        profile=True, trace=False)
-    UpdateRightEncoderTask = cotask.Task(right_Encoder.update,name="Update Right Encoder", priority=1, period=ENCPERIOD,
-                        profile=True, trace=False)
-    RightMotorController = cotask.Task(right_Controller.run,name="Right Controller", priority=1, period=CONTPERIOD,profile=True,trace=True)
-    LeftMotorController = cotask.Task(left_Controller.run,name="Left Controller", priority=1, period=CONTPERIOD,profile=True,trace=True)
+    # Samples both encoders and then runs both controllers, its profile shows the cost of each control tick
+    DriveLoopTask = cotask.Task(driveLoop.run,name="Drive Loop", priority=1, period=CONTPERIOD,profile=True,trace=True)
+    HeadingTask = cotask.Task(headingEstimator.run,name="Heading Estimator",priority=1,period=HEADINGPERIOD,profile=True,
+                        trace=False,shares=(fusedHeading,))
+    OdometryTask = cotask.Task(odometry.run,name="Odometry",priority=1,period=CONTPERIOD,profile=True,trace=False,
+                        shares=(pose,))
+    LineSensorTask = cotask.Task(lineArray.sample,name="Line Sensor",priority=0,period=LINEPERIOD,profile=True,trace=False,
+                        shares=(linePosition,lineTime))
     FSM = cotask.Task(romi_obj.FSM,name="FSM control",priority=0,period=FSMPERIOD,profile=True,trace=False)
+    # Finishes the IMU mode switch and calibration restore without blocking the other tasks
+    IMUBootTask = cotask.Task(lambda: imu.boot(imuCalibration),name="IMU Boot",priority=0,period=IMUBOOTPERIOD,
+                        profile=True,trace=False)
+    I2CTask = cotask.Task(i2c_bus.run,name="I2C Bus",priority=0,period=I2CPERIOD,profile=True,trace=False)
 
     #Append Tasks to IMU
-    cotask.task_list.append(UpdateRightEncoderTask)
-    cotask.task_list.append(UpdateLeftEncoderTask)
-    cotask.task_list.append(RightMotorController)
-    cotask.task_list.append(LeftMotorController)
+    if TIMER_DRIVE:
+        driveLoop.start()
+    else:
+        cotask.task_list.append(DriveLoopTask)
+    cotask.task_list.append(HeadingTask)
+    cotask.task_list.append(OdometryTask)
+    cotask.task_list.append(LineSensorTask)
     cotask.task_list.append(FSM)
+    cotask.task_list.append(IMUBootTask)
+    cotask.task_list.append(I2CTask)
     #run garbage collector
     gc.collect()
 
     # Run the scheduler with the chosen scheduling algorithm. Quit if ^C pressed
-    print("Initialized")
+    print(f"Initialized {time.ticks_ms()} ms after reset")
+    startTime = time.ticks_ms()
     while True:
         try:
             cotask.task_list.pri_sched()
@@ -191,6 +269,19 @@ if __name__ == '__main__':
         except KeyboardInterrupt:
             break
 
+    if TIMER_DRIVE:
+        driveLoop.stop()
+
+    # Print the task profiles (including worst case run times) and shares for diagnostics
+    print(cotask.task_list)
+    print(task_share.show_all())
+    print(i2c_bus)
+    runTime = max(time.ticks_diff(time.ticks_ms(), startTime), 1)/1000 # s
+    for name, motor in (("Left", left_Motor), ("Right", right_Motor)):
+        print(f"{name} motor: {motor.writes/runTime:.1f} hardware writes/s, {motor.skips/runTime:.1f} skipped/s")
+    if TIMER_DRIVE:
+        print(f"Drive loop: {driveLoop.ticks} ticks, {driveLoop.overruns} overruns")
+
     right_Motor.disable()
     left_Motor.disable()
     
\ No newline at end of file
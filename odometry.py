@@ -0,0 +1,109 @@
+## @file odometry.py
+#  This file is the Romi Robot odometry, which tracks the (x, y, heading) pose of the robot
+#  from the wheel encoders
+#
+#  The @c run function runs as a generator task in the scheduler at the control rate. Each run
+#  it converts the change in position of both encoders into the distance driven by the center of
+#  the robot and adds it to the pose along the average heading over the run. The heading comes
+#  from the heading share when one is given (the fused encoder and IMU heading), otherwise from the
+#  difference between the wheels. The pose is kept in a preallocated float array and published as a
+#  whole through a @c task_share.ArrayShare, so readers never see x and y from different runs.
+#  The pose is relative to where @c reset() was last called: x is forward, y is to the right, and
+#  the heading is in degrees clockwise from the starting heading (-180 to 180), like the IMU.
+#
+#  @author Cole Sterba, Devon Bolt
+#  @date   2026-Oct-16 Approximate date of creation of file
+#  @copyright This program is copyright (c) 2024 by C Sterba and D Bolt and
+#             released under the GNU Public License, version 3.0.
+#
+#  It is intended for educational use only, but its use is not limited thereto.
+#  THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+#  AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+#  IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+#  ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+#  LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+#  CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+#  SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+#  INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+#  CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+#  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+#  POSSIBILITY OF SUCH DAMAGE.
+
+import math
+import array
+
+class Odometry:
+    '''!@brief Differential drive odometry giving the pose of the Romi'''
+
+    WHEEL_RADIUS = 35 # mm
+    TRACK_WIDTH = 141 # mm, distance between the wheels
+    TICKS_PER_REV = 1440 # encoder ticks per wheel revolution
+    # indices of the pose array
+    X = 0
+    Y = 1
+    THETA = 2
+
+    def __init__(self, left_encoder, right_encoder, heading_share=None):
+        '''!@brief Constructs an odometry object
+        @param left_encoder Encoder object of the left wheel
+        @param right_encoder Encoder object of the right wheel
+        @param heading_share Optional share holding the absolute heading in degrees. If None the heading
+        is found from the wheels alone
+        '''
+        self.left_encoder = left_encoder
+        self.right_encoder = right_encoder
+        self.heading_share = heading_share
+        self.MM_PER_TICK = 2*math.pi*self.WHEEL_RADIUS/self.TICKS_PER_REV
+        # heading change in degrees for one tick of difference between the wheels
+        self.DEGREES_PER_TICK = 360/self.TICKS_PER_REV*self.WHEEL_RADIUS/self.TRACK_WIDTH
+        self.POSE = array.array('f', [0, 0, 0]) # x (mm), y (mm), heading (degrees), see the X, Y, THETA indices
+        self._reset = True
+
+    def reset(self):
+        '''!@brief Makes the current position the origin and the current heading zero on the next run'''
+        self._reset = True
+
+    def wrap_angle(self, angle):
+        '''!@brief Wrap an angle in degrees to the range -180 to 180'''
+        if angle > 180: angle -= 360
+        if angle < -180: angle += 360
+        return angle
+
+    def run(self, shares):
+        '''!@brief Generator task that updates the pose and puts it in the pose share
+        @param shares A tuple holding the ArrayShare of 3 floats the pose is published to
+        '''
+        pose_share, = shares
+        pose = self.POSE
+        last_left = 0
+        last_right = 0
+        start_heading = 0
+        while 1:
+            left = self.left_encoder.get_position()
+            right = self.right_encoder.get_position()
+            if self.heading_share is not None:
+                heading = self.heading_share.get()
+
+            if self._reset:
+                self._reset = False
+                pose[self.X] = 0
+                pose[self.Y] = 0
+                pose[self.THETA] = 0
+                if self.heading_share is not None:
+                    start_heading = heading
+            else:
+                # Forward is negative encoder ticks
+                distance = -((left-last_left) + (right-last_right))/2*self.MM_PER_TICK
+                if self.heading_share is not None:
+                    theta = self.wrap_angle(heading - start_heading)
+                else:
+                    theta = self.wrap_angle(pose[self.THETA] + ((right-last_right) - (left-last_left))*self.DEGREES_PER_TICK)
+                # Drive along the average heading over this run
+                mid = math.radians(pose[self.THETA] + self.wrap_angle(theta - pose[self.THETA])/2)
+                pose[self.X] += distance*math.cos(mid)
+                pose[self.Y] += distance*math.sin(mid)
+                pose[self.THETA] = theta
+            last_left = left
+            last_right = right
+            pose_share.put(pose)
+            yield 0
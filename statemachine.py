@@ -18,7 +18,14 @@
 #  will be the beginning to the finish line box. This then triggers the transition to state 4, which is 
 #  return to home. This state knows the initial heading, gathered in the beginning of the program, as well
 #  as the distance back to the start box. With these two pieces of information the robot returns to the start
-#  box and upon returning, it transitions back to state 1 (idle).
+#  box and upon returning, it transitions back to state 1 (idle). When an odometry pose share is given,
+#  state 4 instead turns toward the start and drives to it using the (x, y) pose, which is zeroed when the
+#  button is pushed, rather than replaying fixed distances.
+#  Straight segments of a set distance are driven with a trapezoidal @c controller.MotionProfile, which
+#  ramps the speed up and down at the control rate. The state machine steers at the profile velocity and
+#  moves on once the profile reports it is done, rather than counting encoder ticks itself.
+#  All wheel commands go through @c setVelocity() as a forward and a turning speed, which a
+#  @c controller.DriveBase applies to both wheels together.
 #
 #  @author Cole Sterba, Devon Bolt
 #  @date   2024-Nov-12 Approximate date of creation of file
@@ -41,12 +48,16 @@
 
 
 import time
+import math
+import array
 import pyb #type: ignore
 import utime #type: ignore
+from controller import MotionProfile
 
 class statemachine:
     '''!@brief Finite State Machine for handling of Romi's states'''
-    def __init__ (self,left_controller,right_controller,IMU,buttonStatus,lineArray,obstacleDetection):
+    def __init__ (self,left_controller,right_controller,IMU,buttonStatus,lineArray,obstacleDetection,headingShare=None,
+                  odometry=None,poseShare=None,profile=None,driveBase=None):
         self.debug = False
         self.left_controller = left_controller
         self.right_controller = right_controller
@@ -54,9 +65,19 @@ class statemachine:
         self.buttonStatus = buttonStatus
         self.lineArray = lineArray
         self.obstacleDetection = obstacleDetection
+        self.headingShare = headingShare # fused heading estimate, if None the IMU is read directly
         self.gain = -15 
-        self.global_x = 0
-        self.global_y = 0
+        self.lineMaxAge = 80_000 # us, oldest cached line reading the FSM will use before reading the sensors itself
+        self.odometry = odometry # odometry task object, reset when the course starts
+        self.poseShare = poseShare # odometry pose (x, y, heading), if None return home replays fixed distances
+        self.pose = array.array('f', [0, 0, 0]) # local copy of the pose share
+        # motion profile for straight segments, stepped by the drive loop. Without one the FSM steps its own
+        if(profile is None and driveBase is not None): profile = driveBase.profile
+        self.stepProfile = profile is None
+        if(profile is None): profile = MotionProfile(left_controller.encoder, right_controller.encoder)
+        self.profile = profile
+        self.accel = 40 # rad/s^2, acceleration of the straight segments
+        self.driveBase = driveBase # drive base keeping the wheels in sync, if None the controllers are set directly
         
 
 
@@ -79,10 +100,11 @@ class statemachine:
 
             #state 1 idle
             if(state == 1):
-                if(self.buttonStatus.get(in_ISR=False) == True):
+                if(self.buttonStatus.get(in_ISR=False) == True and self.imu.initialized): # wait for the IMU to finish booting
                     state = 2
                     self.buttonStatus.put(False,in_ISR=False)
                     self.starting_Heading = self.imu.get_heading()
+                    if(self.odometry is not None): self.odometry.reset() # the start box is the origin of the pose
                     if(self.debug): print("Running")
                     if(self.debug): print(self.starting_Heading)
                     startCount = 0
@@ -90,7 +112,7 @@ class statemachine:
         
             #state 2 line follow
             if(state == 2):
-                CF = self.lineArray.get_line_position()*self.gain
+                CF = self.lineArray.get_line_position(self.lineMaxAge)*self.gain
                 while(startCount < 22): 
                     CF = 0
                     startCount += 1
@@ -100,16 +122,15 @@ class statemachine:
                         if(self.debug): print("Going Home")
                     else:
                         CF = 0
-                        self.right_controller.setSpeed(-(nominalSpeed-CF))
-                        self.left_controller.setSpeed(-(nominalSpeed+CF))   
+                        self.setVelocity(nominalSpeed,CF)
                 else: 
                     #apply speed increase to appropriate wheel CF = corrective factor
-                    self.right_controller.setSpeed(-(nominalSpeed-CF))
-                    self.left_controller.setSpeed(-(nominalSpeed+CF))
+                    self.setVelocity(nominalSpeed,CF)
                     #check for obstacle
                 if(self.obstacleDetection.get_state() and not obstaclePassed):
                     state = 3 # avoid the obstacle
-                    self.previousHeading = self.starting_Heading # sets the initial heading of the obstacle avoidance path
+                    # sets the initial heading of the obstacle avoidance path, marking the unwrapped heading at the starting heading
+                    self.turnMark = self.imu.get_total_heading() - self.imu.wrap_angle(self.imu.get_heading()-self.starting_Heading)
                     self.totalHeadingChange = 0
                     if(self.debug): print("avoiding obstacle")
                 yield
@@ -121,117 +142,74 @@ class statemachine:
                 while(substate > 0):
                     if(substate == 1): #78 degree CW reversal in place
                         turn_angle = 78
-                        self.currentHeading = self.imu.get_heading()
-                        self.deltaHeading = self.currentHeading-self.previousHeading
-                        self.previousHeading = self.currentHeading
-                        if(self.deltaHeading < -180): self.deltaHeading += 360
-                        self.totalHeadingChange += self.deltaHeading
+                        self.totalHeadingChange = self.imu.heading_change_since(self.turnMark)
                         if(self.totalHeadingChange < turn_angle):
-                            self.right_controller.setSpeed(10) # speeds in rad/s, need to test and tune
-                            self.left_controller.setSpeed(0)
+                            self.setVelocity(-5,5) # pivot on the left wheel, right wheel reversing at 10 rad/s
                         else:
-                            self.previousPosition = self.left_controller.getEncoderPos()
                             self.totalHeadingChange = 0
-                            self.totalPosChange = 0
                             self.straightHeading = self.imu.get_heading()
+                            self.profile.move(1663, straight_speed, self.accel)
                             substate = 2
                             if(self.debug): print("First Turn Finished")
 
                     if(substate == 2): #straight line for 10 inches (1663 encoder ticks)
-                        distance = 1663
-                        self.currentPosition = self.left_controller.getEncoderPos()
-                        self.deltaPosition = self.currentPosition-self.previousPosition
-                        self.previousPosition = self.currentPosition
-                        if(self.deltaPosition > 32768): self.deltaPosition -= 65536
-                        self.totalPosChange += self.deltaPosition
-                        if(self.totalPosChange > -distance):
-                            #self.right_controller.setSpeed(straight_speed*1.1) # speeds in rad/s, need to test and tune
-                            #self.left_controller.setSpeed(straight_speed)
-                            self.headingControl(self.straightHeading,straight_speed)
+                        if(not self.profileDone()):
+                            self.headingControl(self.straightHeading,self.profile.velocity)
                         else:
-                            self.previousHeading = self.imu.get_heading()
+                            self.turnMark = self.imu.get_total_heading()
                             self.totalHeadingChange = 0
-                            self.totalPosChange = 0
                             substate = 3 
                             if(self.debug): print("First Straight Finished")
 
                     if(substate == 3): #80 degree CCW turn in place
                         turn_angle = -80
-                        self.currentHeading = self.imu.get_heading()
-                        self.deltaHeading = self.currentHeading-self.previousHeading
-                        self.previousHeading = self.currentHeading
-                        if(self.deltaHeading > 180): self.deltaHeading -= 360
-                        self.totalHeadingChange += self.deltaHeading
+                        self.totalHeadingChange = self.imu.heading_change_since(self.turnMark)
                         if(self.totalHeadingChange > turn_angle):
-                            self.right_controller.setSpeed(-10) # speeds in rad/s, need to test and tune
-                            self.left_controller.setSpeed(0)
+                            self.setVelocity(5,-5) # pivot on the left wheel, right wheel forward at 10 rad/s
                         else:
-                            self.previousHeading = self.imu.get_heading()
+                            self.turnMark = self.imu.get_total_heading()
                             self.totalHeadingChange = 0
-                            self.totalPosChange = 0
                             self.straightHeading = self.imu.get_heading()
+                            self.profile.move(2660, straight_speed, self.accel)
                             substate = 4
                             if(self.debug): print("Second Turn Finished")
 
                     if(substate == 4): #straight line for 16 in (2660 encoder ticks)
-                        distance = 2660
-                        self.currentPosition = self.left_controller.getEncoderPos()
-                        self.deltaPosition = self.currentPosition-self.previousPosition
-                        self.previousPosition = self.currentPosition
-                        if(self.deltaPosition > 32768): self.deltaPosition -= 65536
-                        self.totalPosChange += self.deltaPosition
-                        if(self.totalPosChange > -distance):
-                            #self.right_controller.setSpeed(straight_speed) # speeds in rad/s, need to test and tune
-                            #self.left_controller.setSpeed(straight_speed*1.2)
-                            self.headingControl(self.straightHeading,straight_speed)
+                        if(not self.profileDone()):
+                            self.headingControl(self.straightHeading,self.profile.velocity)
                         else:
-                            self.previousHeading = self.imu.get_heading()
+                            self.turnMark = self.imu.get_total_heading()
                             self.totalHeadingChange = 0
-                            self.totalPosChange = 0
                             substate = 5 
                             if(self.debug): print("Second Straight Finished")
 
                     if(substate == 5): # 80 CCW degree turn in place
                         turn_angle = -80
-                        self.currentHeading = self.imu.get_heading()
-                        self.deltaHeading = self.currentHeading-self.previousHeading
-                        self.previousHeading = self.currentHeading
-                        if(self.deltaHeading > 180): self.deltaHeading -= 360
-                        self.totalHeadingChange += self.deltaHeading
+                        self.totalHeadingChange = self.imu.heading_change_since(self.turnMark)
                         if(self.totalHeadingChange > turn_angle):
                             # Drive back up circle
-                            self.right_controller.setSpeed(-10) # speeds in rad/s, need to test and tune
-                            self.left_controller.setSpeed(0)
+                            self.setVelocity(5,-5) # pivot on the left wheel, right wheel forward at 10 rad/s
                         else:
                             self.totalHeadingChange = 0
-                            self.totalPosChange = 0
                             self.straightHeading = self.imu.get_heading()
                             substate = 6
 
                     if(substate == 6): #drive straight until line is detected
-                        if(self.lineArray.get_line_position() == 0): 
+                        if(self.lineArray.get_line_position(self.lineMaxAge) == 0): 
                             self.headingControl(self.straightHeading,straight_speed)
                         else:
-                            self.previousHeading = self.imu.get_heading()
+                            self.turnMark = self.imu.get_total_heading()
                             self.totalHeadingChange = 0
-                            self.totalPosChange = 0
                             substate = 7
                             if(self.debug): print("Third Straight Finished")
                         
                     if(substate == 7): #60 CW degree turn in place
                         turn_angle = 60
-                        self.currentHeading = self.imu.get_heading()
-                        self.deltaHeading = self.currentHeading-self.previousHeading
-                        self.previousHeading = self.currentHeading
-                        if(self.deltaHeading < -180): self.deltaHeading += 360
-                        self.totalHeadingChange += self.deltaHeading
+                        self.totalHeadingChange = self.imu.heading_change_since(self.turnMark)
                         if(self.totalHeadingChange < turn_angle):
-                            self.right_controller.setSpeed(10) # speeds in rad/s, need to test and tune
-                            self.left_controller.setSpeed(-10)
+                            self.setVelocity(0,10) # spin in place at 10 rad/s per wheel
                         else:
-                            self.previousPosition = self.left_controller.getEncoderPos()
                             self.totalHeadingChange = 0
-                            self.totalPosChange = 0
                             substate = 0
                             state = 2
                             obstaclePassed = True
@@ -243,6 +221,7 @@ class statemachine:
             if(state == 4):
                 substate = 1
                 desiredHeading = 0 
+                if(self.poseShare is not None): substate = 5 # navigate to the start using the odometry pose
                 while(substate > 0):
                     if(substate ==1): #correct heading
                         if(desiredHeading == 0):
@@ -251,46 +230,48 @@ class statemachine:
                             if(self.debug): print(desiredHeading)
                         #if(self.headingControl(desiredHeading,0)):
                             #if(self.debug): print("First Alignment")
-                        self.previousPosition = self.left_controller.getEncoderPos()
-                        self.totalPosChange = 0    
+                        self.profile.move(700, straight_speed, self.accel)
                         substate = 2
                     if(substate == 2):
-                        distance = 700
-                        self.currentPosition = self.left_controller.getEncoderPos()
-                        self.deltaPosition = self.currentPosition-self.previousPosition
-                        self.previousPosition = self.currentPosition
-                        if(self.deltaPosition > 32768): self.deltaPosition -= 65536
-                        self.totalPosChange += self.deltaPosition
-                        if(self.totalPosChange > -distance): 
-                            self.headingControl(desiredHeading,straight_speed)
+                        if(not self.profileDone()): 
+                            self.headingControl(desiredHeading,self.profile.velocity)
                         else:
-                            self.totalPosChange = 0
                             if(self.debug): print("Second Alignment")
                             substate = 3
                     if(substate == 3):
                         if(self.headingControl(self.starting_Heading,0,1/12)):
                             substate = 4
-                            self.previousPosition = self.left_controller.getEncoderPos()
+                            self.profile.move(7100, 2*straight_speed, self.accel)
                             if(self.debug): print("Third Alignment")
                     if(substate == 4):
-                        distance = 7100
-                        self.currentPosition = self.left_controller.getEncoderPos()
-                        self.deltaPosition = self.currentPosition-self.previousPosition
-                        self.previousPosition = self.currentPosition
-                        if(self.deltaPosition > 32768): self.deltaPosition -= 65536
-                        self.totalPosChange += self.deltaPosition
-                        if(self.totalPosChange > -0.9*distance): 
-                            self.headingControl(self.starting_Heading,2*straight_speed,0.61)
-                        elif(self.totalPosChange > -0.96*distance):
-                            self.headingControl(self.starting_Heading,0.75*straight_speed,1/3)
-                        elif(self.totalPosChange > -distance):
-                            self.headingControl(self.starting_Heading,0.25*straight_speed,1/3)
+                        if(not self.profileDone()): 
+                            # steer softly once the profile slows down, as fast steering at low speed oscillates
+                            gain = 0.61 if self.profile.velocity > straight_speed else 1/3
+                            self.headingControl(self.starting_Heading,self.profile.velocity,gain)
                         else:
-                            self.totalPosChange = 0
                             if(self.debug): print("Fourth Alignment")
                             substate = 0
-                            self.right_controller.setSpeed(0)
-                            self.left_controller.setSpeed(0)
+                            self.setVelocity(0,0)
+                    if(substate == 5): #turn in place toward the start
+                        self.homeHeading, homeDistance = self.homeBearing()
+                        if(self.headingControl(self.homeHeading,0,1/12)):
+                            self.lastHomeDistance = homeDistance
+                            substate = 6
+                            if(self.debug): print("Facing Home")
+                    if(substate == 6): #drive to the start, slowing down as it gets close
+                        homeHeading, homeDistance = self.homeBearing()
+                        if(homeDistance > 80): self.homeHeading = homeHeading # the bearing swings close to the start, so hold the last one
+                        if(homeDistance < 20 or (homeDistance < 80 and homeDistance > self.lastHomeDistance)): # arrived or passed the start
+                            if(self.debug): print("Home")
+                            substate = 0
+                            self.setVelocity(0,0)
+                        elif(homeDistance > 250):
+                            self.headingControl(self.homeHeading,2*straight_speed,0.61)
+                        elif(homeDistance > 80):
+                            self.headingControl(self.homeHeading,0.75*straight_speed,1/3)
+                        else:
+                            self.headingControl(self.homeHeading,0.25*straight_speed,1/3)
+                        self.lastHomeDistance = homeDistance
                     yield
                 state = 1
                 obstaclePassed = False
@@ -303,11 +284,42 @@ class statemachine:
         @param velocity linear velocity to maintain while correcting heading
         @param gain the gain from heading error to rotation speed
         """
-        error = desiredHeading - self.imu.get_heading()
-        if(error > 180): error -= 360
-        if(error < -180): error += 360
+        error = self.imu.wrap_angle(desiredHeading - self.getHeading())
         output = gain*error 
-        self.right_controller.setSpeed(-(velocity-output))
-        self.left_controller.setSpeed(-(velocity+output))
+        self.setVelocity(velocity,output)
         if(abs(error) < 0.35): return True
-        else: return False
\ No newline at end of file
+        else: return False
+
+    def setVelocity(self,velocity,turn):
+        """Drive both wheels, through the drive base if there is one
+        @param velocity forward wheel speed in rad/s
+        @param turn wheel speed in rad/s added to the left wheel and taken from the right wheel, positive turns clockwise
+        """
+        if(self.driveBase is not None):
+            self.driveBase.set_velocity(velocity,turn)
+        else:
+            self.right_controller.setSpeed(-(velocity-turn))
+            self.left_controller.setSpeed(-(velocity+turn))
+
+    def profileDone(self):
+        """Step the motion profile if the FSM owns it, and return True once its move is done"""
+        if(self.stepProfile): self.profile.step()
+        return self.profile.done()
+
+    def homeBearing(self):
+        """Find the way back to the start from the odometry pose
+        @return The heading in degrees (0 to 360) that points at the start, and the distance to it in mm
+        """
+        pose = self.poseShare.get_into(self.pose)
+        # The pose heading is clockwise from the starting heading with y to the right, like the IMU heading
+        bearing = math.degrees(math.atan2(-pose[1], -pose[0]))
+        heading = self.starting_Heading + bearing
+        if(heading >= 360): heading -= 360
+        if(heading < 0): heading += 360
+        return heading, math.sqrt(pose[0]*pose[0] + pose[1]*pose[1])
+
+    def getHeading(self):
+        """Return the current heading in degrees, from the fused heading share if there is one, otherwise from the IMU"""
+        if(self.headingShare is not None):
+            return self.headingShare.get()
+        return self.imu.get_heading()
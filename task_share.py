@@ -410,3 +410,110 @@ class Share (BaseShare):
                 type_code_strings[self._type_code]))
 
 
+# ============================================================================
+
+## An item which holds a fixed length array of data shared between tasks.
+#  This class works like @c Share, but every @c put() replaces all of the
+#  elements with interrupts disabled, so a reader never sees some elements
+#  from one @c put() and the rest from another. It is used for values which
+#  only make sense together, such as the (x, y, heading) pose of a robot.
+# 
+#  An example of the creation and use of an array share is as follows:
+#  @code
+#  import task_share
+# 
+#  # This share holds 3 floats
+#  pose_share = task_share.ArrayShare ('f', 3, name="Pose")
+# 
+#  # Somewhere in one task, put an array of 3 floats into the share
+#  pose_share.put (pose)
+# 
+#  # In another task, copy the data into a preallocated array
+#  pose_share.get_into (my_pose)
+#  @endcode
+class ArrayShare (BaseShare):
+
+    ## A counter used to give serial numbers to array shares for diagnostic use.
+    ser_num = 0
+
+
+    ## Create a shared array used to transfer data between tasks.
+    # 
+    #  This method allocates memory in which the shared data will be buffered.
+    #  @param type_code The type of data items which the share can hold, as
+    #         for @c Share
+    #  @param size The number of elements in the array
+    #  @param thread_protect True if mutual exclusion protection is used
+    #  @param name A short name for the share, default @c ArrayShareN where
+    #         @c N is a serial number for the share
+    def __init__ (self, type_code, size, thread_protect = True, name = None):
+        # First call the parent class initializer
+        super ().__init__ (type_code, thread_protect, name)
+
+        self._buffer = array.array (type_code, [0] * size)
+        self._size = size
+
+        self._name = str (name) if name != None \
+            else 'ArrayShare' + str (ArrayShare.ser_num)
+        ArrayShare.ser_num += 1
+
+
+    ## Write an array of data into the share.
+    # 
+    #  All of the old data is overwritten. Interrupts are disabled while the
+    #  data is copied so that no reader sees a partly written array.
+    #  @param data An array or list with at least as many elements as the share
+    #  @param in_ISR Set this to True if calling from within an ISR
+    @micropython.native
+    def put (self, data, in_ISR = False):
+
+        # Disable interrupts before writing the data
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq ()
+
+        for index in range (self._size):
+            self._buffer[index] = data[index]
+
+        # Re-enable interrupts
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq (irq_state)
+
+
+    ## Copy the data in the share into an array supplied by the caller.
+    # 
+    #  Copying into a preallocated array does not allocate memory. Interrupts
+    #  are disabled while the data is copied.
+    #  @param dest An array with at least as many elements as the share
+    #  @param in_ISR Set this to True if calling from within an ISR
+    #  @return The array @c dest
+    @micropython.native
+    def get_into (self, dest, in_ISR = False):
+        # Disable interrupts before reading the data
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq ()
+
+        for index in range (self._size):
+            dest[index] = self._buffer[index]
+
+        # Re-enable interrupts
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq (irq_state)
+
+        return dest
+
+
+    ## Read a copy of the data in the share.
+    # 
+    #  This allocates a new array on each call; use @c get_into() where
+    #  memory allocation must be avoided.
+    #  @param in_ISR Set this to True if calling from within an ISR
+    #  @return A new array holding the data
+    def get (self, in_ISR = False):
+        return self.get_into (array.array (self._type_code, self._buffer),
+                              in_ISR)
+
+
+    ## Puts diagnostic information about the share into a string.
+    def __repr__ (self):
+        return ("{:<12s} ArrayShare<{:s}>[{:d}]".format (self._name,
+                type_code_strings[self._type_code], self._size))
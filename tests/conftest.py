@@ -0,0 +1,41 @@
+## @file conftest.py
+#  Test setup which runs the Romi modules on the host
+#
+#  The fakes directory holds stand-ins for the MicroPython @c pyb, @c micropython and @c utime modules. The
+#  MicroPython ticks functions are added to the host @c time module, since the drivers call them through it.
+
+import os
+import sys
+import time
+
+import pytest
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS, "fakes"))
+sys.path.insert(0, os.path.dirname(TESTS))
+
+import micropython  # noqa: E402
+import pyb  # noqa: E402
+import utime  # noqa: E402
+
+for _name in ("ticks_us", "ticks_ms", "ticks_diff", "ticks_add", "sleep_us", "sleep_ms"):
+    setattr(time, _name, getattr(utime, _name))
+
+
+@pytest.fixture
+def clock():
+    '''Manual clock for the test, see utime.set_time()'''
+    utime.set_time(0)
+    yield utime
+    utime.real_time()
+
+
+@pytest.fixture(autouse=True)
+def reset_fakes():
+    '''Clear the pin levels, decay times and scheduled callbacks left by the previous test'''
+    pyb.Pin.levels.clear()
+    pyb.Pin.decay.clear()
+    pyb.enable_irq(True)
+    micropython._scheduled.clear()
+    yield
+    utime.real_time()
@@ -0,0 +1,40 @@
+## @file micropython.py
+#  Host stand-in for the MicroPython @c micropython module, used by the tests
+#
+#  Scheduled callbacks are queued like they are on the Nucleo and run when a test calls @c run_scheduled(),
+#  which stands in for the VM running them between bytecodes.
+
+SCHEDULE_DEPTH = 4 # MICROPY_SCHEDULER_DEPTH of the pyboard port
+
+_scheduled = []
+
+
+def const(value):
+    return value
+
+
+def native(function):
+    return function
+
+
+viper = native
+
+
+def alloc_emergency_exception_buf(size):
+    pass
+
+
+def schedule(function, arg):
+    if len(_scheduled) >= SCHEDULE_DEPTH:
+        raise RuntimeError("schedule queue full")
+    _scheduled.append((function, arg))
+
+
+def run_scheduled():
+    '''Run every queued callback, returns how many ran'''
+    count = 0
+    while _scheduled:
+        function, arg = _scheduled.pop(0)
+        function(arg)
+        count += 1
+    return count
@@ -0,0 +1,160 @@
+## @file pyb.py
+#  Host stand-in for the parts of the MicroPython @c pyb module used by the Romi code, used by the tests
+#
+#  Pins configured as inputs read high until the decay time set in @c Pin.decay for their id has passed since
+#  they were switched to input, which models the RC line sensors. Timers keep their callback so a test can fire
+#  it, ADCs return the value in @c v, and the I2C bus reads and writes a 256 byte register map.
+
+import utime
+
+_irq_enabled = True
+
+
+def disable_irq():
+    global _irq_enabled
+    state = _irq_enabled
+    _irq_enabled = False
+    return state
+
+
+def enable_irq(state=True):
+    global _irq_enabled
+    _irq_enabled = state
+
+
+def irq_enabled():
+    '''True unless a test is inside a disable_irq() section'''
+    return _irq_enabled
+
+
+class _Names:
+    '''Pin.cpu and Pin.board, which name each pin by its attribute'''
+    def __getattr__(self, name):
+        return name
+
+
+class Pin:
+    IN = 0
+    OUT_PP = 1
+    ALT = 2
+    PULL_NONE = 0
+    PULL_UP = 1
+    PULL_DOWN = 2
+    cpu = _Names()
+    board = _Names()
+    levels = {} # output level of each pin id
+    decay = {} # us each input pin id reads high for after it is switched to input
+
+    def __init__(self, id, mode=None, pull=None, af=None):
+        self.id = id
+        self.init(mode, pull)
+
+    def init(self, mode=None, pull=None):
+        self.mode = mode
+        if mode == Pin.IN:
+            self._released = utime.ticks_us()
+
+    def high(self):
+        Pin.levels[self.id] = 1
+
+    def low(self):
+        Pin.levels[self.id] = 0
+
+    def value(self, level=None):
+        if level is not None:
+            Pin.levels[self.id] = level
+            return None
+        if self.mode == Pin.IN:
+            return 1 if utime.ticks_diff(utime.ticks_us(), self._released) < Pin.decay.get(self.id, 0) else 0
+        return Pin.levels.get(self.id, 0)
+
+
+class _Channel:
+    def __init__(self):
+        self.percent = 0
+        self.width = 0
+
+    def pulse_width_percent(self, value=None):
+        if value is None:
+            return self.percent
+        self.percent = value
+
+    def pulse_width(self, value=None):
+        if value is None:
+            return self.width
+        self.width = value
+
+
+class Timer:
+    PWM = 1
+    ENC_AB = 2
+
+    def __init__(self, id, freq=None, prescaler=0, period=3999, **kwargs):
+        self.id = id
+        self.freq = freq
+        self._period = period
+        self.count = 0 # counter value, set by tests to move an encoder
+        self.cb = None
+
+    def init(self, freq=None, **kwargs):
+        self.freq = freq
+
+    def deinit(self):
+        self.cb = None
+
+    def channel(self, number, *args, **kwargs):
+        return _Channel()
+
+    def counter(self):
+        return self.count
+
+    def period(self):
+        return self._period
+
+    def callback(self, cb):
+        self.cb = cb
+
+    def fire(self):
+        '''Run the timer callback as if the timer had overflowed'''
+        if self.cb is not None:
+            self.cb(self)
+
+
+class ADC:
+    def __init__(self, pin):
+        self.pin = pin
+        self.v = 0 # reading returned by read()
+
+    def read(self):
+        return self.v
+
+    @staticmethod
+    def read_timed_multi(adcs, buffers, timer):
+        for adc, buffer in zip(adcs, buffers):
+            for i in range(len(buffer)):
+                buffer[i] = adc.v
+        return True
+
+
+class I2C:
+    MASTER = 0
+
+    def __init__(self, bus, mode=None, **kwargs):
+        self.mem = bytearray(256) # register map of the device
+        self.reads = 0
+
+    def init(self, mode=None, **kwargs):
+        pass
+
+    def mem_read(self, data, addr, memaddr):
+        self.reads += 1
+        if isinstance(data, int):
+            return bytes(self.mem[memaddr:memaddr + data])
+        for i in range(len(data)):
+            data[i] = self.mem[memaddr + i]
+        return data
+
+    def mem_write(self, data, addr, memaddr):
+        if isinstance(data, int):
+            data = bytes([data])
+        self.mem[memaddr:memaddr + len(data)] = data
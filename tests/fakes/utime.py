@@ -0,0 +1,73 @@
+## @file utime.py
+#  Host stand-in for the MicroPython @c utime module, used by the tests
+#
+#  Ticks wrap at 2**30 like they do on the Nucleo, so the ticks_diff() and ticks_add() arithmetic of the
+#  drivers is exercised. By default the ticks follow the host clock. @c set_time() switches to a manual
+#  clock which only moves when @c advance() or a sleep is called, or by @c step microseconds each time
+#  ticks_us() is read, which makes busy-wait loops finish in a known number of polls.
+
+import time as _time
+
+TICKS_PERIOD = 1 << 30
+_MASK = TICKS_PERIOD - 1
+_HALF = TICKS_PERIOD // 2
+
+_manual_us = None # manual clock in us, None when the host clock is used
+_step_us = 0 # us the manual clock moves each time ticks_us() is read
+
+
+def set_time(us=0, step=0):
+    '''Switch to the manual clock, starting at the given time in us'''
+    global _manual_us, _step_us
+    _manual_us = us & _MASK
+    _step_us = step
+
+
+def real_time():
+    '''Switch back to the host clock'''
+    global _manual_us
+    _manual_us = None
+
+
+def advance(us):
+    '''Move the manual clock forward'''
+    global _manual_us
+    _manual_us = (_manual_us + us) & _MASK
+
+
+def ticks_us():
+    global _manual_us
+    if _manual_us is None:
+        return (_time.perf_counter_ns() // 1000) & _MASK
+    now = _manual_us
+    _manual_us = (_manual_us + _step_us) & _MASK
+    return now
+
+
+def ticks_ms():
+    if _manual_us is None:
+        return (_time.perf_counter_ns() // 1000000) & _MASK
+    return _manual_us // 1000
+
+
+def ticks_diff(end, start):
+    return ((end - start + _HALF) & _MASK) - _HALF
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & _MASK
+
+
+def sleep_us(us):
+    if _manual_us is None:
+        _time.sleep(us / 1000000)
+    else:
+        advance(us)
+
+
+def sleep_ms(ms):
+    sleep_us(ms * 1000)
+
+
+def sleep(s):
+    sleep_us(int(s * 1000000))
@@ -0,0 +1,73 @@
+## @file heap.py
+#  Host measurement of the objects a function would allocate on the MicroPython heap
+#
+#  There is no MicroPython build on the test host, so allocations are traced in CPython with tracemalloc and
+#  mapped onto the MicroPython object model:
+#  - Floats are boxed on the pyboard, so every float result is a heap allocation. CPython keeps freed floats
+#    (and tuples, lists and dicts) in free lists. tracemalloc moves the trace of a reused block to the line that
+#    reused it, so the traces are checked after every line of the measured modules and each line that gains a
+#    trace is recorded.
+#  - Integers below 2**30 are small ints on MicroPython and never allocate, while CPython allocates a one digit
+#    int object (28 bytes) for anything above 256. Blocks of exactly that size are ignored. Larger ints are
+#    long ints on MicroPython too and are counted.
+#  - Only lines of the given modules are counted, so the test fakes are left out.
+#  Objects without a free list which are freed on the same line that created them are not seen, so this finds
+#  float, container and retained allocations rather than every transient one.
+
+import collections
+import gc
+import sys
+import tracemalloc
+
+SMALL_INT_SIZE = sys.getsizeof(1 << 29) # a CPython int holding a MicroPython small int
+
+
+def _sites(files):
+    '''Number of traced blocks allocated by each line of the given files'''
+    sites = collections.Counter()
+    for trace in tracemalloc.take_snapshot().traces:
+        frame = trace.traceback[-1]
+        if frame.filename in files and trace.size != SMALL_INT_SIZE:
+            sites[f"{frame.filename.split('/')[-1]}:{frame.lineno}"] += 1
+    return sites
+
+
+def heap_allocations(function, *modules, calls=3):
+    '''Runs function after a warm up call and returns the lines of the given modules which allocated
+    @param function Function to measure, called with no arguments
+    @param modules Modules whose lines are counted
+    @param calls Number of measured calls
+    @return Sorted list of "file:line" strings, empty if nothing was allocated
+    '''
+    files = set(module.__file__ for module in modules)
+    found = set()
+    baseline = None
+
+    def check():
+        for site, count in _sites(files).items():
+            if count > baseline[site]:
+                found.add(site)
+
+    def trace(frame, event, arg):
+        if frame.f_code.co_filename not in files:
+            return None
+        if event in ("line", "return"):
+            check()
+        return trace
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function() # warm up, so attributes and caches created on the first call are traced but not counted
+        gc.collect() # empty the free lists, so each reused block has been traced
+        baseline = _sites(files)
+        sys.settrace(trace)
+        try:
+            for i in range(calls):
+                function()
+        finally:
+            sys.settrace(None)
+        check()
+    finally:
+        tracemalloc.stop()
+    return sorted(found)
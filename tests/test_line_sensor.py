@@ -0,0 +1,188 @@
+## @file test_line_sensor.py
+#  Host tests of the line sensor array, with the RC decay of each sensor simulated by the fake pins
+
+import inspect
+
+import pyb
+import pytest
+
+import LineSensor
+from LineSensor import LineSensorArray
+from heap import heap_allocations
+
+PINS = [f"PC{i}" for i in range(8)]
+
+
+def make_array(decays, **kwargs):
+    '''Builds an array on the fake pins, with the decay time in us of each sensor'''
+    for pin, decay in zip(PINS, decays):
+        pyb.Pin.decay[pin] = decay
+    return LineSensorArray("PH0", "PH1", PINS, **kwargs)
+
+
+# Decay times kept clear of the default breakpoints, so the few us a poll takes cannot change a reading
+SURFACES = [
+    [100, 100, 100, 100, 100, 100, 100, 100], # white
+    [100, 100, 350, 1450, 2400, 1450, 350, 100], # line right of center
+    [2400, 1450, 900, 350, 100, 100, 100, 100], # line at the left edge
+    [2400, 2400, 2400, 2400, 2400, 2400, 2400, 2400], # finish line
+    [100, 1450, 100, 100, 100, 100, 1800, 100], # two dark spots
+]
+
+
+@pytest.mark.parametrize("decays", SURFACES)
+def test_parallel_and_sequential_reads_agree(clock, decays):
+    '''One polling loop over all pins gives the same readings and position as timing each pin in turn'''
+    clock.set_time(0, step=1) # every clock read takes 1 us
+    sequential = make_array(decays)
+    parallel = make_array(decays, parallel_read=True)
+
+    sequential.update_line_position()
+    parallel.update_line_position()
+
+    assert list(parallel.READINGS) == list(sequential.READINGS)
+    assert parallel.LINE_POSITION == sequential.LINE_POSITION
+    for i in range(8):
+        # the pins are released one after another and a pass polls every pending pin, which costs a few us
+        assert abs(parallel.VALUES[i] - sequential.VALUES[i]) <= 20
+        assert abs(sequential.VALUES[i] - min(decays[i], 2000)) <= 20
+
+
+def test_parallel_read_takes_one_decay_time(clock):
+    '''A parallel read of a dark surface waits for one cutoff, a sequential read waits for 8'''
+    clock.set_time(0, step=1)
+    decays = SURFACES[3]
+    sequential = make_array(decays)
+    parallel = make_array(decays, parallel_read=True)
+
+    start = clock.ticks_us()
+    sequential.update_line_position()
+    sequential_us = clock.ticks_diff(clock.ticks_us(), start)
+    start = clock.ticks_us()
+    parallel.update_line_position()
+    parallel_us = clock.ticks_diff(clock.ticks_us(), start)
+
+    assert sequential_us >= 8*2000
+    assert parallel_us < 2*2000
+
+
+def ladder_threshold(sensor_reading, sensor):
+    '''threshold_linear() before the threshold table, copied from the original LineSensor.py'''
+    if(sensor==0):
+        if(sensor_reading<600):
+            modified_reading = 0
+        elif(sensor_reading<1200):
+            modified_reading = 0.5
+        elif(sensor_reading<1800):
+            modified_reading = 0.75
+        else:
+            modified_reading = 1
+    elif(sensor==1):
+        if(sensor_reading<700):
+            modified_reading = 0
+        elif(sensor_reading<1200):
+            modified_reading = 0.5
+        elif(sensor_reading<1900):
+            modified_reading = 0.75
+        else:
+            modified_reading = 1
+    elif(sensor==2):
+        if(sensor_reading<600):
+            modified_reading = 0
+        elif(sensor_reading<1100):
+            modified_reading = 0.5
+        elif(sensor_reading<1700):
+            modified_reading = 0.75
+        else:
+            modified_reading = 1
+    elif(sensor==3):
+        if(sensor_reading<600):
+            modified_reading = 0
+        elif(sensor_reading<1100):
+            modified_reading = 0.5
+        elif(sensor_reading<1700):
+            modified_reading = 0.75
+        else:
+            modified_reading = 1
+    elif(sensor==4):
+        if(sensor_reading<700):
+            modified_reading = 0
+        elif(sensor_reading<1200):
+            modified_reading = 0.5
+        elif(sensor_reading<1600):
+            modified_reading = 0.75
+        else:
+            modified_reading = 1
+    elif(sensor==5):
+        if(sensor_reading<600):
+            modified_reading = 0
+        elif(sensor_reading<1000):
+            modified_reading = 0.5
+        elif(sensor_reading<1600):
+            modified_reading = 0.75
+        else:
+            modified_reading = 1
+    elif(sensor==6):
+        if(sensor_reading<600):
+            modified_reading = 0
+        elif(sensor_reading<1100):
+            modified_reading = 0.5
+        elif(sensor_reading<1900):
+            modified_reading = 0.75
+        else:
+            modified_reading = 1
+    elif(sensor==7):
+        if(sensor_reading<800):
+            modified_reading = 0
+        elif(sensor_reading<1300):
+            modified_reading = 0.5
+        elif(sensor_reading<1950):
+            modified_reading = 0.75
+        else:
+            modified_reading = 1
+
+    return modified_reading
+
+
+def test_threshold_table_matches_original_ladder():
+    '''The default table gives the same reading as the original if/elif ladder for every decay time of every sensor'''
+    array = make_array([0]*8)
+    for sensor in range(8):
+        for reading in range(0, 2001):
+            assert array.threshold_linear(reading, sensor) == ladder_threshold(reading, sensor), (sensor, reading)
+            assert array.threshold_level(reading, sensor) == ladder_threshold(reading, sensor)*4
+
+
+def centroid_lines():
+    '''Source lines of centroid(), where the line position float is created'''
+    source, first = inspect.getsourcelines(LineSensorArray.centroid)
+    return range(first, first+len(source))
+
+
+@pytest.mark.parametrize("mode", [{}, {"parallel_read": True}, {"roi": True}, {"roi": True, "parallel_read": True}])
+def test_line_read_allocates_only_the_position(clock, mode):
+    '''A read of the array creates no objects other than the line position float centroid() returns'''
+    clock.set_time(0, step=1)
+    array = make_array(SURFACES[1], **mode)
+    allocations = heap_allocations(array.update_line_position, LineSensor)
+    for allocation in allocations:
+        assert int(allocation.split(":")[1]) in centroid_lines(), allocations
+    if mode.get("roi"):
+        assert array._roi_reads > 0 # the measured reads were region reads, not only full sweeps
+
+
+def test_cached_line_position_does_not_allocate(clock):
+    '''get_line_position() with a fresh cached reading creates no objects at all'''
+    clock.set_time(0, step=1)
+    array = make_array(SURFACES[1])
+    array.update_line_position()
+    assert heap_allocations(lambda: array.get_line_position(1_000_000), LineSensor) == []
+
+
+def test_region_all_on_levels_match_percentage():
+    '''The integer all-on level of each region width is the smallest total at or above ALL_ON_PERCENT'''
+    array = make_array([0]*8)
+    for width in range(1, 9):
+        for total in range(0, 4*width+1):
+            assert (total >= array.ALL_ON_LEVELS[width]) == (total >= width*4*array.ALL_ON_PERCENT)
+    assert array.ALL_ON_LEVEL == array.ALL_ON_LEVELS[8]